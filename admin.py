@@ -1,36 +1,28 @@
-import threading
 import time
 import os
 from telebot import types
 
+import job_executor
+import lazy_loader
+import progress_reporter
+import report_delivery
+
 # --- ИМПОРТЫ МОДУЛЕЙ ---
-# 1. Парсер рабочий
-try:
-    import parse_work
-except ImportError:
-    parse_work = None
-
-# 2. Парсер инкассаций
-try:
-    import parse_ink
-except ImportError:
-    parse_ink = None
-
-# 3. Парсер сервиса (НОВЫЙ)
-try:
-    import parse_service
-except ImportError:
-    parse_service = None
-
-# 4. Отчеты и задачи
-try:
-    import otchet_work
-    import all_zadaci
-except ImportError:
-    pass
+# Парсеры и отчеты тянут pandas, selenium, folium — импортируются при первом обращении
+# (bool(модуль) == False, если файла или зависимостей нет)
+parse_work = lazy_loader.lazy('parse_work')        # 1. Парсер рабочий
+parse_ink = lazy_loader.lazy('parse_ink')          # 2. Парсер инкассаций
+parse_service = lazy_loader.lazy('parse_service')  # 3. Парсер сервиса
+otchet_work = lazy_loader.lazy('otchet_work')      # 4. Отчеты и задачи
+all_zadaci = lazy_loader.lazy('all_zadaci')
+route_planner = lazy_loader.lazy('route_planner')  # 5. План маршрутов
+
+PIPELINE_MODULES = [parse_work, parse_ink, parse_service, all_zadaci, route_planner]
 
 # --- КЛАВИАТУРА ---
 def get_keyboard():
+    # Вход админа: пока он выбирает действие, конвейеры прогреваются в фоне
+    lazy_loader.preload(*PIPELINE_MODULES)
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     
     btn1 = types.KeyboardButton('парсинг рабочий')
@@ -43,14 +35,22 @@ def get_keyboard():
     
     btn7 = types.KeyboardButton('все задачи')
     btn8 = types.KeyboardButton('выйти с роли')
+    btn9 = types.KeyboardButton('план маршрутов')
+    btn10 = types.KeyboardButton('процессы')
     
     markup.add(btn1, btn2, btn3)
     markup.add(btn4, btn5, btn6)
-    markup.add(btn7, btn8)
+    markup.add(btn7, btn9, btn10)
+    markup.add(btn8)
     return markup
 
-# --- УНИВЕРСАЛЬНЫЙ ЗАПУСКАТЕЛЬ В ПОТОКЕ ---
-def launch_process_in_thread(bot, chat_id, worker_func, start_message_text):
+# --- УНИВЕРСАЛЬНЫЙ ЗАПУСКАТЕЛЬ (ОЧЕРЕДЬ ПРОЦЕССОВ) ---
+def launch_process_in_thread(bot, chat_id, worker_func, start_message_text, kind=None):
+    """
+    Ставит процесс в общую очередь (фиксированный пул потоков job_executor).
+    kind — вид процесса: пока он идет, повторное нажатие только подписывает чат на его статус.
+    """
+    kind = kind or start_message_text
     try:
         msg = bot.send_message(chat_id, f"⏳ {start_message_text}")
         message_id = msg.message_id
@@ -68,13 +68,24 @@ def launch_process_in_thread(bot, chat_id, worker_func, start_message_text):
             last_text_container["text"] = text_message
         except Exception: pass
 
-    def thread_target():
+    # Этапы шлют прогресс часто (по аппарату) — в чат уходит не чаще раза в несколько секунд, из фонового потока
+    reporter = progress_reporter.ThrottledReporter(telegram_callback)
+
+    def job_target(progress):
         try:
-            worker_func(telegram_callback)
+            worker_func(progress)
+        except job_executor.JobCancelled:
+            raise
         except Exception as e:
             bot.send_message(chat_id, f"❌ Ошибка в процессе: {e}")
+            raise
 
-    threading.Thread(target=thread_target, daemon=True).start()
+    executor = job_executor.get_executor()
+    job, attached = executor.submit(kind, job_target, reporter.update, on_done=reporter.close)
+    if attached:
+        bot.send_message(chat_id, f"ℹ️ «{kind}» уже выполняется (#{job.id}) — показываю его статус.")
+    elif job.status == job_executor.QUEUED and executor.busy():
+        reporter.update(f"{start_message_text} (в очереди: все потоки заняты)")
 
 
 # --- ОБРАБОТЧИК СООБЩЕНИЙ ---
@@ -89,7 +100,7 @@ def handle_message(bot, message):
             return
         launch_process_in_thread(bot, chat_id, 
             lambda cb: parse_work.run_full_cycle(callback=cb), 
-            "Запуск рабочего парсера...")
+            "Запуск рабочего парсера...", kind=text)
 
     # ================= ПАРСИНГ ИНКАССАЦИЙ =================
     elif text == 'парсинг инкасаций':
@@ -104,13 +115,12 @@ def handle_message(bot, message):
                 time.sleep(0.5)
                 bot.send_message(chat_id, parse_ink.get_final_report_text())
                 try:
-                    with open('otchet_inki.txt', 'rb') as f:
-                        bot.send_document(chat_id, f, caption="Полный отчет (файл)")
+                    report_delivery.deliver(bot, chat_id, 'otchet_inki.txt', caption="Полный отчет (файл)")
                 except: pass
             else:
                 callback("❌ Процесс завершился с ошибкой.")
 
-        launch_process_in_thread(bot, chat_id, worker, "Запуск парсера инкассаций...")
+        launch_process_in_thread(bot, chat_id, worker, "Запуск парсера инкассаций...", kind=text)
 
     # ================= ПАРСИНГ СЕРВИСА (НОВОЕ) =================
     elif text == 'парсинг сервиса':
@@ -126,32 +136,30 @@ def handle_message(bot, message):
                 # Отправляем файлы
                 try:
                     if os.path.exists('otchet_service.txt'):
-                        with open('otchet_service.txt', 'rb') as f:
-                            bot.send_document(chat_id, f, caption="📄 Лог сервиса")
+                        report_delivery.deliver(bot, chat_id, 'otchet_service.txt', caption="📄 Лог сервиса")
                     
                     if os.path.exists('interactive_routes_map.html'):
-                        with open('interactive_routes_map.html', 'rb') as f:
-                            bot.send_document(chat_id, f, caption="🗺️ Интерактивная карта")
+                        report_delivery.deliver(bot, chat_id, 'interactive_routes_map.html',
+                                                caption="🗺️ Интерактивная карта")
                 except Exception as e:
                     bot.send_message(chat_id, f"Ошибка отправки файлов: {e}")
             else:
                 callback("❌ Ошибка при парсинге сервиса.")
 
-        launch_process_in_thread(bot, chat_id, worker, "Запуск парсера сервиса...")
+        launch_process_in_thread(bot, chat_id, worker, "Запуск парсера сервиса...", kind=text)
 
     # ================= ОТЧЕТЫ =================
     elif text == 'отчет для работы':
-        bot.send_message(chat_id, "📊 Формирую отчет...")
-        try:
-            if 'otchet_work' in globals():
-                threading.Thread(target=otchet_work.run, args=(bot, chat_id, None)).start()
-            else: bot.send_message(chat_id, "Скрипт otchet_work.py не найден.")
-        except Exception as e: bot.send_message(chat_id, f"Ошибка: {e}")
+        if not otchet_work:
+            bot.send_message(chat_id, "Скрипт otchet_work.py не найден.")
+            return
+        launch_process_in_thread(bot, chat_id, lambda cb: otchet_work.run(bot, chat_id, None),
+                                 "Формирую отчет...", kind=text)
 
     elif text == 'отчет по инкасациям':
         try:
-            with open('otchet_inki.txt', 'rb') as f:
-                bot.send_document(chat_id, f, caption="📂 Последний отчет по инкассациям")
+            # Файл не менялся — уходит по file_id, без повторной загрузки; большой — в zip
+            report_delivery.deliver(bot, chat_id, 'otchet_inki.txt', caption="📂 Последний отчет по инкассациям")
         except FileNotFoundError:
              bot.send_message(chat_id, "❌ Отчет еще не сформирован.")
 
@@ -160,13 +168,11 @@ def handle_message(bot, message):
         files_sent = 0
         try:
             if os.path.exists('otchet_service.txt'):
-                with open('otchet_service.txt', 'rb') as f:
-                    bot.send_document(chat_id, f, caption="📄 Отчет по сервису")
-                    files_sent += 1
+                report_delivery.deliver(bot, chat_id, 'otchet_service.txt', caption="📄 Отчет по сервису")
+                files_sent += 1
             if os.path.exists('interactive_routes_map.html'):
-                with open('interactive_routes_map.html', 'rb') as f:
-                    bot.send_document(chat_id, f, caption="🗺️ Карта маршрутов")
-                    files_sent += 1
+                report_delivery.deliver(bot, chat_id, 'interactive_routes_map.html', caption="🗺️ Карта маршрутов")
+                files_sent += 1
             
             if files_sent == 0:
                 bot.send_message(chat_id, "❌ Файлы отчетов не найдены. Запустите парсинг сервиса.")
@@ -174,13 +180,38 @@ def handle_message(bot, message):
             bot.send_message(chat_id, f"❌ Ошибка: {e}")
 
     # ================= ДРУГОЕ =================
-    elif text == 'все задачи':
-        bot.send_message(chat_id, "📋 Выгружаю базу данных...")
-        try:
-            if 'all_zadaci' in globals():
-                threading.Thread(target=all_zadaci.run, args=(bot, chat_id)).start()
-            else: bot.send_message(chat_id, "Скрипт all_zadaci.py не найден.")
-        except Exception as e: bot.send_message(chat_id, f"Ошибка: {e}")
+    elif text.startswith('все задачи'):
+        # 'все задачи [2025-11-01] [2025-11-30] [activ|finish] [csv]' — фильтры выгрузки
+        if not all_zadaci:
+            bot.send_message(chat_id, "Скрипт all_zadaci.py не найден.")
+            return
+        filters = all_zadaci.parse_filters(text)
+        # Вид процесса — весь текст: та же выгрузка не запускается дважды, с другими фильтрами — своя
+        launch_process_in_thread(bot, chat_id, lambda cb: all_zadaci.run(bot, chat_id, **filters),
+                                 "Выгружаю базу данных...", kind=text)
+
+    elif text == 'план маршрутов':
+        if not route_planner:
+            bot.send_message(chat_id, "❌ Модуль route_planner.py не найден.")
+            return
+        # Через общую очередь: повторное нажатие подписывается на уже идущее планирование
+        launch_process_in_thread(bot, chat_id, lambda cb: route_planner.run(bot, chat_id),
+                                 "Строю план объезда...", kind=text)
+
+    # ================= ОЧЕРЕДЬ ПРОЦЕССОВ =================
+    elif text == 'процессы':
+        bot.send_message(chat_id, job_executor.get_executor().status_text() +
+                         "\n\nОтменить: «отмена <название>», например «отмена парсинг рабочий»")
+
+    elif text.startswith('отмена '):
+        kind = text[len('отмена '):].strip()
+        job = job_executor.get_executor().cancel(kind)
+        if not job:
+            bot.send_message(chat_id, f"ℹ️ «{kind}» сейчас не выполняется.")
+        elif job.status == job_executor.CANCELLED:
+            bot.send_message(chat_id, f"⛔ «{kind}» убран из очереди.")
+        else:
+            bot.send_message(chat_id, f"⛔ «{kind}» будет остановлен после текущего этапа.")
 
     elif text == 'выйти с роли':
         return "EXIT"
@@ -1,47 +1,111 @@
-import pandas as pd
 import os
+import re
+import csv
+import gzip
 from datetime import datetime
+from openpyxl import Workbook
 import utils
+import report_delivery
+
+CHUNK_ROWS = 1000  # строк за один fetchmany — память не растет с историей задач
+COLUMNS = ['num', 'assignee', 'id_terem', 'adress', 'zadaca', 'texnik',
+           'date_time_start', 'status', 'date_time_finish', 'vremyareakcii']
+STATUSES = ('activ', 'finish')
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def parse_filters(text):
+    """
+    Фильтры из текста команды: 'все задачи [с] [по] [activ|finish] [csv]'.
+    Одна дата — с этого дня, две — диапазон (включительно).
+    """
+    words = text.lower().split()
+    dates = DATE_RE.findall(text)
+    return {
+        'date_from': dates[0] if dates else None,
+        'date_to': dates[1] if len(dates) > 1 else None,
+        'status': next((w for w in words if w in STATUSES), None),
+        'fmt': 'csv' if 'csv' in words else 'xlsx',
+    }
+
+
+def iter_tasks(conn, date_from=None, date_to=None, status=None):
+    """Задачи порциями в порядке индекса (status, date_time_start): сначала активные, потом завершенные"""
+    where, params = [], []
+    if date_from:
+        where.append("date_time_start >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("date_time_start < date(?, '+1 day')")
+        params.append(date_to)
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM tasks"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY status, date_time_start"
+
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        yield from rows
+
+
+def write_xlsx(path, rows):
+    # write_only: строки сразу уходят в файл, в памяти не держится весь лист
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("tasks")
+    ws.append(COLUMNS)
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
 
-def run(bot, chat_id):
-    conn = utils.get_db_connection()
-    tables = ['zadaci_rus', 'zadaci_dmu', 'zadaci_igo', 'zadaci_texd', 'zadaci_finan', 'zadaci_cal']
-    filename = f"All_Tasks_Full_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
-    
-    all_data = []
 
+def write_csv_gz(path, rows):
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def export(path, fmt='xlsx', date_from=None, date_to=None, status=None):
+    """Выгрузка задач в файл; возвращает кол-во строк"""
+    conn = utils.get_db_connection()
     try:
-        for table in tables:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}';")
-            if not cursor.fetchone():
-                continue
-
-            # Берем ВСЕ задачи (без фильтра по статусу)
-            query = f"SELECT * FROM {table}"
-            df = pd.read_sql_query(query, conn)
-            
-            if not df.empty:
-                df['Tech_Table'] = table # Помечаем, чей это стол
-                all_data.append(df)
-
-        if not all_data:
-            bot.send_message(chat_id, "📭 База данных задач пуста.")
-            return
+        rows = iter_tasks(conn, date_from, date_to, status)
+        return write_csv_gz(path, rows) if fmt == 'csv' else write_xlsx(path, rows)
+    finally:
+        conn.close()
 
-        final_df = pd.concat(all_data, ignore_index=True)
-        
-        # Красивая сортировка: сначала активные, потом завершенные
-        final_df = final_df.sort_values(by=['status', 'date_time_start'])
 
-        final_df.to_excel(filename, index=False)
+def run(bot, chat_id, date_from=None, date_to=None, status=None, fmt='xlsx'):
+    ext = 'csv.gz' if fmt == 'csv' else 'xlsx'
+    filename = f"All_Tasks_Full_{datetime.now().strftime('%Y-%m-%d')}.{ext}"
 
-        with open(filename, 'rb') as file:
-            bot.send_document(chat_id, file, caption="🗂 Полная выгрузка всех задач (История)")
+    try:
+        count = export(filename, fmt, date_from, date_to, status)
+        if not count:
+            bot.send_message(chat_id, "📭 База данных задач пуста.")
+            return
 
-        os.remove(filename)
+        caption = "🗂 Полная выгрузка всех задач (История)"
+        if date_from or date_to or status:
+            caption = f"🗂 Выгрузка задач: {date_from or '…'} — {date_to or '…'} {status or ''}".rstrip()
+        report_delivery.deliver(bot, chat_id, filename, caption=f"{caption}, строк: {count}")
 
     except Exception as e:
         bot.send_message(chat_id, f"❌ Ошибка: {e}")
     finally:
-        conn.close()
\ No newline at end of file
+        if os.path.exists(filename):
+            report_delivery.discard(filename)
+            os.remove(filename)
@@ -1,7 +1,10 @@
 from telebot import types
 import utils
+import session_store
 
-USER_CONTEXT = {} # Хранение состояния: 'wait_device', 'wait_client_name', 'task_type'
+# Хранение состояния: 'wait_device', 'wait_client_name', 'task_type' (брошенный диалог забывается через сутки)
+CONTEXT_TTL = 24 * 3600
+USER_CONTEXT = session_store.SessionStore('calcentr', ttl=CONTEXT_TTL)
 
 def get_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
@@ -21,7 +24,11 @@ def handle_message(bot, message):
     # 1. Главное меню
     if text == 'поставить задачу':
         bot.send_message(chat_id, "Выберите тип проблемы:", reply_markup=get_task_menu())
-        USER_CONTEXT[chat_id] = {'step': 'wait_task_type'}
+        USER_CONTEXT.set(chat_id, {'step': 'wait_task_type'})
+        return
+
+    elif text == 'статус выполнения задач':
+        bot.send_message(chat_id, utils.get_task_report())
         return
 
     elif text == 'выйти с роли':
@@ -33,19 +40,19 @@ def handle_message(bot, message):
         task_type = text
         if text == 'свое описание':
              bot.send_message(chat_id, "Напишите суть проблемы:", reply_markup=types.ReplyKeyboardRemove())
-             USER_CONTEXT[chat_id] = {'step': 'wait_custom_desc', 'is_card': False}
+             USER_CONTEXT.set(chat_id, {'step': 'wait_custom_desc', 'is_card': False})
         elif text == '⬜ заказ карты клиена⬜':
              bot.send_message(chat_id, "Введите название или номер аппарата:", reply_markup=types.ReplyKeyboardRemove())
-             USER_CONTEXT[chat_id] = {'step': 'wait_device', 'task_type': 'карта клиена', 'is_card': True}
+             USER_CONTEXT.set(chat_id, {'step': 'wait_device', 'task_type': 'карта клиена', 'is_card': True})
         else:
              # Стандартная задача
              bot.send_message(chat_id, "Введите название или номер аппарата:", reply_markup=types.ReplyKeyboardRemove())
-             USER_CONTEXT[chat_id] = {'step': 'wait_device', 'task_type': text, 'is_card': False}
+             USER_CONTEXT.set(chat_id, {'step': 'wait_device', 'task_type': text, 'is_card': False})
         return
 
     # 3. Если выбрали "свое описание", ждем текст
     if state == 'wait_custom_desc':
-        USER_CONTEXT[chat_id].update({'task_type': text, 'step': 'wait_device'})
+        USER_CONTEXT.update(chat_id, {'task_type': text, 'step': 'wait_device'})
         bot.send_message(chat_id, "Введите название или номер аппарата:")
         return
 
@@ -59,22 +66,24 @@ def handle_message(bot, message):
             return # Ждем повторного ввода
         
         # Аппарат найден
-        current_context = USER_CONTEXT[chat_id]
-        tech_name = device_data['texnik'] # ruslan, dmutro, igor
+        current_context = USER_CONTEXT.get(chat_id)
+        tech_name = (device_data['texnik'] or '').strip().lower() # ruslan, dmutro, igor
         
-        # Определяем таблицу по имени техника
-        table_map = {'ruslan': 'zadaci_rus', 'dmutro': 'zadaci_dmu', 'igor': 'zadaci_igo'}
-        target_table = table_map.get(tech_name)
-        
-        if not target_table:
-            bot.send_message(chat_id, f"Ошибка: Техник {tech_name} не найден в системе.")
+        # Исполнитель задачи — техник из привязки (общая таблица задач, схему менять не нужно)
+        if not tech_name:
+            bot.send_message(chat_id, f"Ошибка: у аппарата {device_data['id_terem']} не указан техник.")
+            return
+        # Опечатка в привязке дала бы задачу, которую никто не увидит
+        if tech_name not in utils.TECH_ASSIGNEES:
+            bot.send_message(chat_id, f"Ошибка: у аппарата {device_data['id_terem']} неизвестный техник "
+                                      f"'{device_data['texnik']}'. Исправьте привязку или выберите другой аппарат.")
             return
 
         # Если это карта клиента, нужно спросить имя
         if current_context.get('is_card'):
-            USER_CONTEXT[chat_id].update({
+            USER_CONTEXT.update(chat_id, {
                 'device_data': device_data, 
-                'target_table': target_table,
+                'assignee': tech_name,
                 'step': 'wait_client_name'
             })
             bot.send_message(chat_id, "Введите Имя Клиента:")
@@ -82,7 +91,7 @@ def handle_message(bot, message):
 
         # Сохраняем обычную задачу
         task_text = current_context['task_type']
-        utils.add_task_to_db(target_table, device_data['id_terem'], device_data['adress'], task_text, tech_name)
+        utils.add_task_to_db(tech_name, device_data['id_terem'], device_data['adress'], task_text, tech_name)
         
         bot.send_message(chat_id, f"✅ Задача '{task_text}' добавлена технику {tech_name} (Аппарат: {device_data['adress']})", reply_markup=get_keyboard())
         USER_CONTEXT.pop(chat_id, None)
@@ -91,12 +100,12 @@ def handle_message(bot, message):
     # 5. Если карта клиента, ждем имя
     if state == 'wait_client_name':
         client_name = text
-        ctx = USER_CONTEXT[chat_id]
+        ctx = USER_CONTEXT.get(chat_id)
         task_text = f"карта клиена {client_name}"
         device_data = ctx['device_data']
         
-        utils.add_task_to_db(ctx['target_table'], device_data['id_terem'], device_data['adress'], task_text, device_data['texnik'])
+        utils.add_task_to_db(ctx['assignee'], device_data['id_terem'], device_data['adress'], task_text, ctx['assignee'])
         
-        bot.send_message(chat_id, f"✅ Заказ карты на имя {client_name} добавлен технику {device_data['texnik']}", reply_markup=get_keyboard())
+        bot.send_message(chat_id, f"✅ Заказ карты на имя {client_name} добавлен технику {ctx['assignee']}", reply_markup=get_keyboard())
         USER_CONTEXT.pop(chat_id, None)
         return
\ No newline at end of file
@@ -0,0 +1,88 @@
+import time
+import queue
+import threading
+from collections import deque, defaultdict
+
+# Обработка апдейтов бота на пуле потоков: сообщения одного чата — строго по порядку,
+# разные чаты — параллельно. Медленный поиск или выгрузка одного пользователя не держат остальных.
+
+NUM_WORKERS = 4
+LATENCY_SAMPLES = 200  # последних замеров на обработчик для перцентилей
+
+
+class LatencyStats:
+    """Время ожидания в очереди и работы обработчика по меткам (роль, команда)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = defaultdict(int)
+        self.total = defaultdict(float)
+        self.samples = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self.wait = deque(maxlen=LATENCY_SAMPLES)
+
+    def add(self, label, seconds, waited):
+        with self.lock:
+            self.count[label] += 1
+            self.total[label] += seconds
+            self.samples[label].append(seconds)
+            self.wait.append(waited)
+
+    @staticmethod
+    def _pct(values, q):
+        values = sorted(values)
+        return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+    def text(self):
+        with self.lock:
+            lines = ["⏱ ОБРАБОТКА СООБЩЕНИЙ"]
+            if self.wait:
+                lines.append(f"Ожидание в очереди: p50 {self._pct(self.wait, 0.5) * 1000:.0f} мс, "
+                             f"p95 {self._pct(self.wait, 0.95) * 1000:.0f} мс")
+            for label in sorted(self.count):
+                s = self.samples[label]
+                lines.append(f"{label}: {self.count[label]} шт, среднее {self.total[label] / self.count[label] * 1000:.0f} мс, "
+                             f"p95 {self._pct(s, 0.95) * 1000:.0f} мс, макс {max(s) * 1000:.0f} мс")
+        return "\n".join(lines)
+
+
+class ChatDispatcher:
+    def __init__(self, num_workers=NUM_WORKERS):
+        self.lock = threading.Lock()
+        self.chats = {}             # chat_id -> очередь сообщений чата
+        self.ready = queue.Queue()  # чаты, у которых есть сообщения и которых никто не обрабатывает
+        self.stats = LatencyStats()
+        self.workers = [threading.Thread(target=self._worker, daemon=True, name=f"chat-worker-{i}")
+                        for i in range(num_workers)]
+        for w in self.workers:
+            w.start()
+
+    def submit(self, chat_id, handler, message, label='message'):
+        """Ставит handler(message) в очередь чата; чат планируется, только если сейчас не обрабатывается"""
+        item = (handler, message, label, time.monotonic())
+        with self.lock:
+            pending = self.chats.get(chat_id)
+            if pending is None:
+                self.chats[chat_id] = deque([item])
+                self.ready.put(chat_id)
+            else:
+                pending.append(item)
+
+    def _worker(self):
+        while True:
+            chat_id = self.ready.get()
+            with self.lock:
+                handler, message, label, queued_at = self.chats[chat_id].popleft()
+            started = time.monotonic()
+            try:
+                handler(message)
+            except Exception as e:
+                print(f"Ошибка обработчика ({label}): {e}")
+            finally:
+                self.stats.add(label, time.monotonic() - started, started - queued_at)
+            with self.lock:
+                if self.chats[chat_id]:
+                    # Следующее сообщение чата — в конец общей очереди, чтобы не занимать поток одним чатом
+                    self.ready.put(chat_id)
+                else:
+                    # Очередь чата пуста — следующий submit снова его запланирует
+                    del self.chats[chat_id]
@@ -1,35 +1,96 @@
 import sqlite3
 
-def create_db():
-    conn = sqlite3.connect('voda_analitik.db')
-    cursor = conn.cursor()
-
-    # Шаблон создания таблицы задач
-    table_template = """
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        num INTEGER PRIMARY KEY AUTOINCREMENT,
-        id_terem INTEGER,
-        adress TEXT,
-        zadaca TEXT,
-        texnik TEXT,
-        date_time_start DATETIME,
-        status TEXT DEFAULT 'activ',
-        date_time_finish DATETIME,
-        vremyareakcii INTEGER
-    )
+DB_FILE = 'voda_analitik.db'
+
+# Старые таблицы задач (по таблице на исполнителя) -> исполнитель в общей таблице tasks
+LEGACY_TABLES = {
+    'zadaci_rus': 'ruslan',
+    'zadaci_dmu': 'dmutro',
+    'zadaci_igo': 'igor',
+    'zadaci_cal': 'calcentr',  # Для колцентра
+    'zadaci_texd': 'texd',
+    'zadaci_finan': 'finan',
+}
+
+TASK_COLUMNS = ['id_terem', 'adress', 'zadaca', 'texnik', 'date_time_start', 'status',
+                'date_time_finish', 'vremyareakcii']
+
+
+def create_tasks_table(conn):
+    """Одна таблица задач для всех исполнителей (новый исполнитель — просто новое значение assignee)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            num INTEGER PRIMARY KEY AUTOINCREMENT,
+            assignee TEXT NOT NULL,
+            id_terem INTEGER,
+            adress TEXT,
+            zadaca TEXT,
+            texnik TEXT,
+            date_time_start DATETIME,
+            status TEXT DEFAULT 'activ',
+            date_time_finish DATETIME,
+            vremyareakcii INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assignee_status ON tasks(assignee, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_start ON tasks(date_time_start)")
+    # Порядок полной выгрузки: сначала активные, потом завершенные
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_start ON tasks(status, date_time_start)")
+
+
+def migrate_legacy_tables(conn):
+    """
+    Переносит строки из zadaci_* в tasks и удаляет старые таблицы (в одной транзакции).
+    Номера задач сохраняются; у разных исполнителей они могли совпадать — тогда строка
+    из более поздней таблицы получает новый номер.
+    Возвращает (кол-во перенесенных задач, [(исполнитель, старый номер, новый номер)] для активных перенумерованных).
     """
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    legacy = [t for t in LEGACY_TABLES if t in existing]
+    if not legacy:
+        return 0, []
+
+    cols = ', '.join(TASK_COLUMNS)
+    moved = 0
+    renumbered = []
+    with conn:
+        for table in legacy:
+            assignee = LEGACY_TABLES[table]
+            taken = [r[0] for r in conn.execute(f"SELECT num FROM {table} WHERE num IN (SELECT num FROM tasks) ORDER BY num")]
+            # Сначала строки со свободными номерами — как были
+            cur = conn.execute(
+                f"INSERT INTO tasks (num, assignee, {cols}) SELECT num, ?, {cols} FROM {table} "
+                f"WHERE num NOT IN (SELECT num FROM tasks) ORDER BY num",
+                (assignee,)
+            )
+            moved += cur.rowcount
+            # Совпавшие номера — новые (AUTOINCREMENT, больше всех существующих)
+            for old_num in taken:
+                cur = conn.execute(
+                    f"INSERT INTO tasks (assignee, {cols}) SELECT ?, {cols} FROM {table} WHERE num = ?",
+                    (assignee, old_num)
+                )
+                moved += 1
+                status = conn.execute(f"SELECT status FROM {table} WHERE num = ?", (old_num,)).fetchone()[0]
+                if status == 'activ':
+                    renumbered.append((assignee, old_num, cur.lastrowid))
+            conn.execute(f"DROP TABLE {table}")
+    return moved, renumbered
 
-    # Создаем таблицы для каждого техника
-    cursor.execute(table_template.format(table_name="zadaci_rus"))
-    cursor.execute(table_template.format(table_name="zadaci_dmu"))
-    cursor.execute(table_template.format(table_name="zadaci_igo"))
-    cursor.execute(table_template.format(table_name="zadaci_cal")) # Для колцентра
-    cursor.execute(table_template.format(table_name="zadaci_texd")) 
-    cursor.execute(table_template.format(table_name="zadaci_finan"))
 
+def create_db():
+    conn = sqlite3.connect(DB_FILE)
+
+    create_tasks_table(conn)
     conn.commit()
+    moved, renumbered = migrate_legacy_tables(conn)
+
     conn.close()
-    print("База данных и таблицы успешно созданы.")
+    print("База данных и таблица задач успешно созданы.")
+    if moved:
+        print(f"Перенесено задач из старых таблиц: {moved}")
+    for assignee, old_num, new_num in renumbered:
+        print(f"⚠️ {assignee}: активная задача {old_num} теперь под номером {new_num}")
 
 if __name__ == "__main__":
-    create_db()
\ No newline at end of file
+    create_db()
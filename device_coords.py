@@ -0,0 +1,217 @@
+import os
+import pandas as pd
+
+import geocache
+
+DEVICES_FILE = 'devices.csv'
+PRIVYAZKA_FILE = 'privyazka_aparat_texnik.csv'
+
+# Таблицы лежат в geocache.db рядом с кешем адресов:
+#   device_coords — один ряд на аппарат (координаты заполняются один раз)
+#   device_alias  — текст аппарата из событий -> device_id (регулярки — один раз на новый текст)
+
+
+_READY = False
+
+
+def _conn():
+    global _READY
+    cache = geocache.get_cache()
+    if _READY:
+        return cache
+    with cache.lock:
+        cache.conn.execute("""
+            CREATE TABLE IF NOT EXISTS device_coords (
+                device_id INTEGER PRIMARY KEY,
+                name TEXT,
+                addr TEXT,
+                norm TEXT,
+                texnik TEXT,
+                lat REAL,
+                lon REAL,
+                source TEXT
+            )
+        """)
+        cache.conn.execute("CREATE INDEX IF NOT EXISTS idx_device_coords_norm ON device_coords(norm)")
+        cache.conn.execute("""
+            CREATE TABLE IF NOT EXISTS device_alias (
+                name TEXT PRIMARY KEY,
+                device_id INTEGER,
+                addr TEXT,
+                norm TEXT
+            )
+        """)
+        cache.conn.commit()
+    _READY = True
+    return cache
+
+
+def _read_csv(path):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+
+
+def sync_devices(clean_func, key_func):
+    """
+    Добавляет в таблицу новые аппараты из devices.csv и файла привязки,
+    дозаполняет отсутствующие координаты. Известные координаты не трогает.
+    Возвращает кол-во новых аппаратов.
+    """
+    cache = _conn()
+    devices = _read_csv(DEVICES_FILE)
+    privyazka = _read_csv(PRIVYAZKA_FILE)
+
+    if not devices.empty:
+        devices = devices.rename(columns={'id': 'device_id'})[['device_id', 'name', 'lat', 'lon']]
+    else:
+        devices = pd.DataFrame(columns=['device_id', 'name', 'lat', 'lon'])
+    if not privyazka.empty:
+        privyazka = privyazka.rename(columns={'id_terem': 'device_id'})[['device_id', 'adress', 'texnik']]
+    else:
+        privyazka = pd.DataFrame(columns=['device_id', 'adress', 'texnik'])
+
+    df = devices.merge(privyazka, on='device_id', how='outer').fillna('')
+    df['device_id'] = pd.to_numeric(df['device_id'].str.strip(), errors='coerce')
+    df = df.dropna(subset=['device_id']).drop_duplicates('device_id')
+    df['device_id'] = df['device_id'].astype(int)
+    df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
+    df['lon'] = pd.to_numeric(df['lon'], errors='coerce')
+
+    with cache.lock:
+        known = {r[0] for r in cache.conn.execute("SELECT device_id FROM device_coords")}
+    new = df[~df['device_id'].isin(known)]
+
+    rows = []
+    for device_id, name, adress, texnik, lat, lon in zip(new['device_id'], new['name'], new['adress'],
+                                                         new['texnik'], new['lat'], new['lon']):
+        addr = clean_func(name or adress)
+        has_coords = pd.notna(lat) and pd.notna(lon)
+        rows.append((int(device_id), name, addr, key_func(addr), texnik.strip().lower(),
+                     float(lat) if has_coords else None, float(lon) if has_coords else None,
+                     'devices' if has_coords else None))
+
+    with cache.lock:
+        cache.conn.executemany(
+            "INSERT INTO device_coords (device_id, name, addr, norm, texnik, lat, lon, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        # Координаты, появившиеся в devices.csv позже
+        with_coords = df.dropna(subset=['lat', 'lon'])
+        cache.conn.executemany(
+            "UPDATE device_coords SET lat = ?, lon = ?, source = 'devices' WHERE device_id = ? AND lat IS NULL",
+            [(float(la), float(lo), int(i)) for i, la, lo in zip(with_coords['device_id'], with_coords['lat'], with_coords['lon'])]
+        )
+        # Тексты событий из devices.csv сразу известны
+        cache.conn.executemany(
+            "INSERT OR IGNORE INTO device_alias (name, device_id, addr, norm) "
+            "SELECT name, device_id, addr, norm FROM device_coords WHERE device_id = ? AND name != ''",
+            [(r[0],) for r in rows]
+        )
+        # Ранее не привязанные тексты могли совпасть с новыми аппаратами
+        cache.conn.execute("""
+            UPDATE device_alias SET device_id = (
+                SELECT d.device_id FROM device_coords d WHERE d.norm = device_alias.norm LIMIT 1)
+            WHERE device_id IS NULL AND norm != ''
+        """)
+        cache.conn.commit()
+
+    refresh_from_geocache()
+    return len(rows)
+
+
+def register_names(names, clean_func, key_func):
+    """Заводит алиасы для новых текстов аппаратов (очистка адреса — только для них)"""
+    cache = _conn()
+    names = [n for n in pd.unique(pd.Series(list(names), dtype=object).dropna()) if str(n).strip()]
+    known = set()
+    with cache.lock:
+        for i in range(0, len(names), geocache.SQL_CHUNK):
+            chunk = names[i:i + geocache.SQL_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            known.update(r[0] for r in cache.conn.execute(
+                f"SELECT name FROM device_alias WHERE name IN ({marks})", chunk))
+
+    new = [n for n in names if n not in known]
+    if not new:
+        return 0
+
+    rows = []
+    for name in new:
+        addr = clean_func(name)
+        rows.append((name, addr, key_func(addr)))
+
+    with cache.lock:
+        by_norm = {}
+        norms = list({r[2] for r in rows if r[2]})
+        for i in range(0, len(norms), geocache.SQL_CHUNK):
+            chunk = norms[i:i + geocache.SQL_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            for norm, device_id in cache.conn.execute(
+                    f"SELECT norm, MIN(device_id) FROM device_coords WHERE norm IN ({marks}) GROUP BY norm", chunk):
+                by_norm[norm] = device_id
+        cache.conn.executemany(
+            "INSERT OR IGNORE INTO device_alias (name, device_id, addr, norm) VALUES (?, ?, ?, ?)",
+            [(name, by_norm.get(norm), addr, norm) for name, addr, norm in rows]
+        )
+        cache.conn.commit()
+    return len(new)
+
+
+def lookup(names):
+    """
+    Координаты для текстов аппаратов одним запросом:
+    DataFrame [aparat, device_id, addr, norm, lat, lon] (только для зарегистрированных текстов).
+    """
+    cache = _conn()
+    names = list(names)
+    rows = []
+    with cache.lock:
+        for i in range(0, len(names), geocache.SQL_CHUNK):
+            chunk = names[i:i + geocache.SQL_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            rows.extend(cache.conn.execute(f"""
+                SELECT a.name, a.device_id, COALESCE(d.addr, a.addr), COALESCE(d.norm, a.norm),
+                       COALESCE(d.lat, g.lat), COALESCE(d.lon, g.lon)
+                FROM device_alias a
+                LEFT JOIN device_coords d ON d.device_id = a.device_id
+                LEFT JOIN geocache g ON g.norm = COALESCE(d.norm, a.norm)
+                WHERE a.name IN ({marks})
+            """, chunk))
+    return pd.DataFrame(rows, columns=['aparat', 'device_id', 'addr', 'norm', 'lat', 'lon'])
+
+
+def unresolved(names):
+    """{norm: addr} для текстов без координат — их нужно отдать геокодеру"""
+    df = lookup(names)
+    df = df[df['lat'].isna() & (df['norm'] != '')]
+    return dict(zip(df['norm'], df['addr']))
+
+
+def refresh_from_geocache():
+    """Переносит найденные геокодером координаты в таблицу аппаратов"""
+    cache = _conn()
+    with cache.lock:
+        cache.conn.execute("""
+            UPDATE device_coords SET
+                lat = (SELECT g.lat FROM geocache g WHERE g.norm = device_coords.norm),
+                lon = (SELECT g.lon FROM geocache g WHERE g.norm = device_coords.norm),
+                source = 'geocache'
+            WHERE lat IS NULL
+              AND norm IN (SELECT norm FROM geocache WHERE lat IS NOT NULL)
+        """)
+        cache.conn.commit()
+
+
+def by_ids(device_ids):
+    """Координаты и адреса по списку device_id: DataFrame [device_id, addr, texnik, lat, lon]"""
+    cache = _conn()
+    ids = [int(i) for i in device_ids]
+    rows = []
+    with cache.lock:
+        for i in range(0, len(ids), geocache.SQL_CHUNK):
+            chunk = ids[i:i + geocache.SQL_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            rows.extend(cache.conn.execute(
+                f"SELECT device_id, addr, texnik, lat, lon FROM device_coords WHERE device_id IN ({marks})", chunk))
+    return pd.DataFrame(rows, columns=['device_id', 'addr', 'texnik', 'lat', 'lon'])
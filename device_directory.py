@@ -0,0 +1,169 @@
+import os
+import re
+import csv
+import threading
+from collections import namedtuple
+
+# Справочник аппаратов из файла привязки: читается один раз и перечитывается,
+# только когда у файла меняется mtime. Поиск — по готовым индексам, без pandas.
+
+CSV_FILE = 'privyazka_aparat_texnik.csv'
+NGRAM = 3
+
+FUZZY_MIN = 0.3      # ниже — не показываем как вариант
+FUZZY_ACCEPT = 0.8   # выше (и заметно лучше второго варианта) — считаем найденным
+FUZZY_MARGIN = 0.15
+
+# Латиница -> кириллица (укр. транслитерация, сначала многобуквенные сочетания)
+TRANSLIT = [('shch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'),
+            ('yu', 'ю'), ('iu', 'ю'), ('ya', 'я'), ('ia', 'я'), ('ye', 'є'), ('ie', 'є'), ('yi', 'ї'),
+            ('a', 'а'), ('b', 'б'), ('v', 'в'), ('w', 'в'), ('h', 'г'), ('g', 'ґ'), ('d', 'д'),
+            ('e', 'е'), ('z', 'з'), ('y', 'и'), ('i', 'і'), ('j', 'й'), ('k', 'к'), ('q', 'к'),
+            ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'), ('r', 'р'), ('s', 'с'),
+            ('t', 'т'), ('u', 'у'), ('f', 'ф'), ('c', 'ц'), ('x', 'кс')]
+LATIN_RE = re.compile('|'.join(src for src, _ in TRANSLIT))
+TRANSLIT_MAP = dict(TRANSLIT)
+
+# Укр./рус. варианты букв сводятся к одной
+FOLD = str.maketrans({'ґ': 'г', 'є': 'е', 'э': 'е', 'ё': 'е', 'ї': 'и', 'і': 'и', 'ы': 'и',
+                      'й': 'и', 'ь': '', 'ъ': ''})
+APOSTROPHES_RE = re.compile(r"['’ʼ`´]")
+# Служебные слова адреса. STREET_WORDS — общий с parse_service.normalize_for_cache (ключи геокеша),
+# нечеткий поиск дополнительно выбрасывает сокращения
+STREET_WORDS = r"вул\.|вулиця|улица|ул\.|проспект|пр\.|буд\.|будинок"
+STREET_WORDS_RE = re.compile(STREET_WORDS + r"|просп\.|пл\.|площа")
+TOKEN_RE = re.compile(r"[а-я]+|\d+")
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def normalize_address(text):
+    """Адрес для нечеткого поиска: токены без служебных слов, апострофов и различий укр./рус./латиницы"""
+    a = APOSTROPHES_RE.sub('', str(text).lower())
+    a = LATIN_RE.sub(lambda m: TRANSLIT_MAP[m.group()], a)
+    a = STREET_WORDS_RE.sub(' ', a)
+    return TOKEN_RE.findall(a.translate(FOLD))
+
+
+def house_numbers(text):
+    """Числа адреса (номер дома, корпус): нечеткое совпадение с другим номером — это другой аппарат"""
+    return [t for t in normalize_address(text) if t.isdigit()]
+
+
+def fuzzy_grams(text):
+    """Триграммы токенов с отступами (как в pg_trgm): 'антонича6' и 'Антонича, 6' совпадают"""
+    grams = set()
+    for token in normalize_address(text):
+        grams |= _ngrams(f"  {token} ")
+    return grams
+
+
+# Индексы одной версии файла. Перечитывание собирает новый снимок и подменяет его
+# одним присваиванием; поиск берет снимок один раз и не видит смеси старого и нового.
+#   rows       — словари строк файла (как было в DataFrame: все значения — строки)
+#   addr       — адрес в нижнем регистре, без пробелов по краям
+#   by_id      — id в нижнем регистре -> [номера строк]
+#   by_ngram   — триграмма адреса -> множество номеров строк
+#   by_fuzzy   — триграмма нормализованного адреса -> номера строк
+#   fuzzy_size — кол-во нечетких триграмм у строки
+Snapshot = namedtuple('Snapshot', 'rows addr by_id by_ngram by_fuzzy fuzzy_size')
+EMPTY = Snapshot([], [], {}, {}, {}, [])
+
+
+class DeviceDirectory:
+    def __init__(self, path=CSV_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.index = EMPTY
+
+    def _load(self):
+        with open(self.path, encoding='utf-8-sig', newline='') as f:
+            rows = [{k: (v or '') for k, v in r.items()} for r in csv.DictReader(f)]
+
+        addr, by_id, by_ngram, by_fuzzy, fuzzy_size = [], {}, {}, {}, []
+        for i, r in enumerate(rows):
+            a = r.get('adress', '').strip().lower()
+            addr.append(a)
+            by_id.setdefault(r.get('id_terem', '').strip().lower(), []).append(i)
+            for g in _ngrams(a):
+                by_ngram.setdefault(g, set()).add(i)
+            grams = fuzzy_grams(a)
+            fuzzy_size.append(len(grams))
+            for g in grams:
+                by_fuzzy.setdefault(g, []).append(i)
+
+        self.index = Snapshot(rows, addr, by_id, by_ngram, by_fuzzy, fuzzy_size)
+
+    def refresh(self):
+        """Перечитывает файл, если он изменился. False — файла нет."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    self._load()
+                    self.mtime = mtime
+        return True
+
+    def find(self, query):
+        """
+        Точное совпадение по ID или подстрока адреса (регистр не важен).
+        Возвращает строки в порядке файла.
+        """
+        index = self.index
+        q = str(query).strip().lower()
+        hits = set(index.by_id.get(q, ()))
+
+        if len(q) >= NGRAM:
+            # Кандидаты — строки, где есть все триграммы запроса; подстроку проверяем только у них
+            grams = sorted(_ngrams(q), key=lambda g: len(index.by_ngram.get(g, ())))
+            candidates = set(index.by_ngram.get(grams[0], ()))
+            for g in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= index.by_ngram.get(g, set())
+        else:
+            candidates = range(len(index.rows))
+        hits.update(i for i in candidates if q in index.addr[i])
+
+        return [dict(index.rows[i]) for i in sorted(hits)]
+
+    def search(self, query, k=5, min_score=FUZZY_MIN):
+        """
+        Нечеткий поиск по адресу: сходство триграмм (доля общих от объединения).
+        Возвращает до k пар (score, строка), лучшие первыми.
+        """
+        index = self.index
+        grams = fuzzy_grams(query)
+        if not grams:
+            return []
+        common = {}
+        for g in grams:
+            for i in index.by_fuzzy.get(g, ()):
+                common[i] = common.get(i, 0) + 1
+
+        scored = []
+        for i, c in common.items():
+            score = c / (len(grams) + index.fuzzy_size[i] - c)
+            if score >= min_score:
+                scored.append((-score, i))
+        scored.sort()
+        return [(round(-score, 3), dict(index.rows[i])) for score, i in scored[:k]]
+
+
+_DIRECTORY = None
+_DIRECTORY_LOCK = threading.Lock()
+
+
+def get_directory(path=CSV_FILE):
+    """Общий справочник процесса"""
+    global _DIRECTORY
+    with _DIRECTORY_LOCK:
+        if _DIRECTORY is None or _DIRECTORY.path != path:
+            _DIRECTORY = DeviceDirectory(path)
+        return _DIRECTORY
@@ -0,0 +1,74 @@
+import os
+import hashlib
+import threading
+
+import utils
+
+# Повторная отправка отчетов по file_id Telegram: файл загружается один раз,
+# дальше, пока содержимое не изменилось, уходит только ссылка на уже загруженный документ.
+# Ключ — sha256 содержимого; изменился файл — новый хеш, старая запись просто не находится.
+
+HASH_BLOCK = 1 << 20
+
+_lock = threading.Lock()
+_hashes = {}  # path -> (mtime_ns, size, sha256): не перечитывать большую карту на каждый запрос
+_ready = False
+
+
+def _conn():
+    global _ready
+    conn = utils.db()
+    if not _ready:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS telegram_files (
+                path TEXT PRIMARY KEY,
+                hash TEXT,
+                file_id TEXT
+            )
+        """)
+        conn.commit()
+        _ready = True
+    return conn
+
+
+def file_hash(path):
+    st = os.stat(path)
+    with _lock:
+        cached = _hashes.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _lock:
+        _hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def send_document(bot, chat_id, path, caption=None):
+    """
+    Отправляет файл: по сохраненному file_id, если содержимое то же, иначе загрузкой.
+    FileNotFoundError — как у open(), если файла нет.
+    """
+    digest = file_hash(path)
+    conn = _conn()
+    row = conn.execute("SELECT hash, file_id FROM telegram_files WHERE path = ?", (path,)).fetchone()
+    if row and row[0] == digest:
+        try:
+            return bot.send_document(chat_id, row[1], caption=caption)
+        except Exception as e:
+            # file_id мог устареть (другой бот, удаленный файл) — просто загружаем заново
+            print(f"⚠️ file_id для {path} не принят, загружаю файл: {e}")
+
+    with open(path, 'rb') as f:
+        msg = bot.send_document(chat_id, f, caption=caption)
+    document = getattr(msg, 'document', None)
+    if document is not None:
+        with conn:
+            conn.execute("""
+                INSERT INTO telegram_files (path, hash, file_id) VALUES (?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET hash = excluded.hash, file_id = excluded.file_id
+            """, (path, digest, document.file_id))
+    return msg
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Расстояние по прямой (км) для массивов координат, поэлементно"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+
+
+def distance_matrix(lats, lons):
+    """Матрица попарных расстояний (км) n x n для набора точек"""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def route_km(df, by, lat="lat", lon="lon"):
+    """
+    Километраж всех маршрутов сразу: строки df уже отсортированы в порядке объезда,
+    by — колонки маршрута (например ["data", "tech"]). Возвращает Series с индексом by.
+    """
+    g = df.groupby(by, sort=False)
+    step = haversine_np(g[lat].shift(), g[lon].shift(), df[lat], df[lon])
+    step = pd.Series(step, index=df.index).fillna(0.0)
+    return step.groupby([df[c] for c in by]).sum()
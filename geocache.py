@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+import requests
+
+GEOCACHE_DB = 'geocache.db'
+LEGACY_CACHE_FILE = 'address_cache.json'  # старый JSON-кеш, импортируется один раз
+CITY_HINT = 'Львів'
+SQL_CHUNK = 500  # лимит переменных в одном запросе SQLite
+
+
+# ======================== КЕШ ========================
+
+class GeoCache:
+    """Кеш геокодирования в SQLite. Ключ — нормализованный адрес, lat/lon NULL — адрес не найден."""
+
+    def __init__(self, path=GEOCACHE_DB):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocache (
+                norm TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                provider TEXT,
+                updated_at TEXT
+            )
+        """)
+        self.conn.commit()
+        self._import_legacy_json()
+
+    def _import_legacy_json(self):
+        if not os.path.exists(LEGACY_CACHE_FILE):
+            return
+        with self.lock:
+            if self.conn.execute("SELECT COUNT(*) FROM geocache").fetchone()[0] > 0:
+                return
+            try:
+                with open(LEGACY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except Exception:
+                return
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO geocache (norm, lat, lon, provider, updated_at) VALUES (?, ?, ?, 'legacy', ?)",
+                [(k, v.get('lat'), v.get('lon'), now) for k, v in legacy.items()]
+            )
+            self.conn.commit()
+
+    def lookup_many(self, norms):
+        """Пакетный поиск: {norm: (lat, lon)} только для адресов, которые уже есть в кеше"""
+        norms = list(norms)
+        found = {}
+        with self.lock:
+            for i in range(0, len(norms), SQL_CHUNK):
+                chunk = norms[i:i + SQL_CHUNK]
+                marks = ','.join('?' * len(chunk))
+                for norm, lat, lon in self.conn.execute(
+                        f"SELECT norm, lat, lon FROM geocache WHERE norm IN ({marks})", chunk):
+                    found[norm] = (lat, lon)
+        return found
+
+    def store_many(self, rows):
+        """rows: [(norm, lat, lon, provider)]"""
+        if not rows:
+            return
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO geocache (norm, lat, lon, provider, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(norm, lat, lon, provider, now) for norm, lat, lon, provider in rows]
+            )
+            self.conn.commit()
+
+
+# ======================== ПРОВАЙДЕРЫ ========================
+# Провайдер: geocode(address, norm) -> (lat, lon), (None, None) если не найден,
+# исключение — временная ошибка (результат не кешируется).
+
+class NominatimProvider:
+    """OpenStreetMap Nominatim (не чаще 1 запроса в секунду)"""
+    name = 'nominatim'
+    min_interval = 1.0
+    URL = "https://nominatim.openstreetmap.org/search"
+
+    def __init__(self, city_hint=CITY_HINT):
+        self.city_hint = city_hint
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": "WaterRoutesBot/1.0"})
+
+    def geocode(self, address, norm):
+        params = {"q": f"{self.city_hint} {address}", "format": "json", "limit": 1, "addressdetails": 0}
+        resp = self.session.get(self.URL, params=params, timeout=10)
+        resp.raise_for_status()
+        data = resp.json()
+        if not data:
+            return None, None
+        return float(data[0]["lat"]), float(data[0]["lon"])
+
+
+# ======================== ФОНОВАЯ ОЧЕРЕДЬ ========================
+
+class GeocodeQueue:
+    """Фоновый поток: отправляет промахи кеша сетевым провайдерам с соблюдением их лимитов"""
+
+    def __init__(self, cache, providers):
+        self.cache = cache
+        self.providers = providers
+        self.q = queue.Queue()
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.last_call = {p.name: 0.0 for p in providers}
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit_many(self, items, log=print):
+        """
+        items: [(norm, address)]. Уже стоящие в очереди адреса повторно не добавляются.
+        log едет вместе с адресом: очередь общая, а сообщения нужны тому запуску, что их поставил.
+        """
+        added = 0
+        with self.pending_lock:
+            for norm, address in items:
+                if norm in self.pending:
+                    continue
+                self.pending.add(norm)
+                self.q.put((norm, address, log))
+                added += 1
+        return added
+
+    def wait(self, timeout):
+        """Ждет опустошения очереди не дольше timeout секунд. Возвращает кол-во оставшихся."""
+        deadline = time.time() + timeout
+        while self.q.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.1)
+        return self.q.unfinished_tasks
+
+    def _throttle(self, provider):
+        delay = provider.min_interval - (time.time() - self.last_call[provider.name])
+        if delay > 0:
+            time.sleep(delay)
+        self.last_call[provider.name] = time.time()
+
+    def _worker(self):
+        while True:
+            norm, address, log = self.q.get()
+            try:
+                result, failed = None, False
+                for provider in self.providers:
+                    self._throttle(provider)
+                    try:
+                        lat, lon = provider.geocode(address, norm)
+                    except Exception as e:
+                        log(f"⚠️ {provider.name}: ошибка для '{address}': {e}")
+                        failed = True
+                        continue
+                    if lat is not None:
+                        result = (norm, lat, lon, provider.name)
+                        break
+
+                if result:
+                    self.cache.store_many([result])
+                    log(f"✓ Геокод: '{address}'")
+                elif not failed:
+                    # Все провайдеры ответили "не найдено" — запоминаем, чтобы не спрашивать снова
+                    self.cache.store_many([(norm, None, None, 'none')])
+                    log(f"✖ Не найдено: '{address}'")
+            finally:
+                with self.pending_lock:
+                    self.pending.discard(norm)
+                self.q.task_done()
+
+
+# Кеш и очередь живут все время работы процесса бота: недогеокоженные
+# адреса дорешиваются в фоне между запусками парсинга.
+_CACHE = None
+_QUEUE = None
+_INIT_LOCK = threading.RLock()
+
+
+def get_cache():
+    global _CACHE
+    with _INIT_LOCK:
+        if _CACHE is None:
+            _CACHE = GeoCache()
+        return _CACHE
+
+
+def get_queue(providers=None):
+    """Общая фоновая очередь. providers учитываются только при первом создании (по умолчанию Nominatim)."""
+    global _QUEUE
+    with _INIT_LOCK:
+        if _QUEUE is None:
+            _QUEUE = GeocodeQueue(get_cache(), providers or [NominatimProvider()])
+        return _QUEUE
+
+
+def resolve_addresses(addresses, online_providers=None, log=print, wait_seconds=30):
+    """
+    Этап геокодирования. addresses: {norm: address}.
+    1) пакетный поиск в кеше, 2) остальное — в фоновую очередь.
+    Ждет очередь не дольше wait_seconds, дальше она работает в фоне.
+    Возвращает словарь со статистикой.
+    """
+    cache = get_cache()
+    addresses = {n: a for n, a in addresses.items() if n}
+    hits = cache.lookup_many(addresses.keys())
+    # В сеть — только то, чего в кеше нет совсем (закешированное "не найдено" не переспрашиваем)
+    misses = {n: a for n, a in addresses.items() if n not in hits}
+
+    stats = {"total": len(addresses), "cached": sum(1 for lat, _ in hits.values() if lat is not None),
+             "queued": len(misses), "left": 0}
+    if misses:
+        q = get_queue(online_providers)
+        q.submit_many(misses.items(), log)
+        stats["left"] = q.wait(wait_seconds)
+    return stats
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Привязка инкассаций к техникам одним набором операций над столбцами (без iterrows/apply):
+#   1) card_id карты техника  2) device_id по файлу привязки  3) имя техника в descr из API.
+# Общая для stage10_ink и stage10a_ink.
+
+CARD_TECH = {
+    '14147': 'ruslan',
+    '23129': 'igor',
+    '9576': 'igor',
+    '24662': 'dmutro'
+}
+
+KNOWN_TECHS = ['igor', 'dmutro', 'ruslan']
+
+# Имена в descr приходят то нормально, то в кривой кодировке
+DESCR_REPLACEMENTS = {
+    'Р†РіРѕСЂ': 'igor',
+    'Р”РјРёС‚СЂРѕ': 'dmutro',
+    'Р СѓСЃР»Р°РЅ': 'ruslan',
+    'Игорь': 'igor',
+    'Дмитро': 'dmutro',
+    'Руслан': 'ruslan'
+}
+
+EMPTY_VALUES = {'nan': '', 'none': '', 'null': ''}
+
+
+def _per_unique(values, func):
+    """func над уникальными значениями и раздача по строкам: аппаратов, карт и описаний единицы-сотни"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return pd.Series(func(pd.Series(uniques, dtype=object)).to_numpy()[codes], index=values.index)
+
+
+def id_keys(values):
+    """Идентификаторы строками: 153, 153.0, ' 153' -> '153'; пустые -> ''"""
+    return _per_unique(values, lambda u: u.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+                       .replace(EMPTY_VALUES))
+
+
+def load_binding(path):
+    """
+    Привязка аппарат -> техник (Series, индекс — id строкой).
+    Столбцы id_terem/id и texnik, иначе первый и последний; при повторах id — последняя строка.
+    """
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    id_col = next((c for c in ('id_terem', 'id') if c in df.columns), df.columns[0])
+    tech_col = 'texnik' if 'texnik' in df.columns else df.columns[-1]
+    keys = id_keys(df[id_col])
+    techs = df[tech_col].str.strip().str.lower()
+    keep = (keys != '') & (techs != '')
+    binding = pd.Series(techs[keep].values, index=keys[keep].values)
+    return binding[~binding.index.duplicated(keep='last')]
+
+
+def normalize_descr(descr):
+    """Описание инкассации: без хвоста ' - ', с исправленной кодировкой имен, в нижнем регистре"""
+    def normalize(u):
+        u = u.fillna('').astype(str).str.strip().str.replace(r'[\s-]+$', '', regex=True)
+        return u.replace(DESCR_REPLACEMENTS).str.lower().str.strip().replace(EMPTY_VALUES)
+
+    return _per_unique(descr, normalize)
+
+
+def attribute(df, binding=None):
+    """
+    Техник по каждой строке и источник ('card', 'device', 'descr' или '').
+    Возвращает (tech, source) — Series того же индекса, пустая строка, если техник не найден.
+    """
+    tech = id_keys(df['card_id']).map(CARD_TECH) if 'card_id' in df.columns else pd.Series(np.nan, index=df.index)
+    source = pd.Series(np.where(tech.notna(), 'card', ''), index=df.index, dtype=object)
+
+    if binding is not None and len(binding):
+        by_device = id_keys(df['device_id']).map(binding)
+        fill = tech.isna() & by_device.notna()
+        tech = tech.where(~fill, by_device)
+        source[fill] = 'device'
+
+    if 'descr' in df.columns:
+        descr = normalize_descr(df['descr'])
+        fill = tech.isna() & descr.isin(KNOWN_TECHS)
+        tech = tech.where(~fill, descr)
+        source[fill] = 'descr'
+
+    return tech.fillna(''), source
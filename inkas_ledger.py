@@ -0,0 +1,109 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Накопительный журнал инкассаций: вместо ежедневной выкачки 5 недель по каждому аппарату
+# дозагружается только окно с прошлой загрузки (плюс перекрытие на запоздавшие записи).
+# Повторы отсекаются ключом (device_id, date, card_id, sum), отчеты берут любой период из журнала.
+
+LEDGER_DB = 'inkas_ledger.db'
+INITIAL_WEEKS = 5   # новый аппарат — первая загрузка за 5 недель, как раньше
+OVERLAP_DAYS = 2    # перекрытие окна: записи, которые API отдает с опозданием
+
+COLUMNS = ['device_id', 'address', 'date', 'card_id', 'sum', 'banknotes', 'coins', 'descr']
+
+
+def connect():
+    conn = sqlite3.connect(LEDGER_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS inkas (
+            device_id INTEGER,
+            address TEXT,
+            date TEXT,
+            card_id TEXT,
+            sum TEXT,
+            banknotes TEXT,
+            coins TEXT,
+            descr TEXT,
+            PRIMARY KEY (device_id, date, card_id, sum)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inkas_date ON inkas(date)")
+    # fetched_until — до какого момента API уже опрошен по аппарату
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS inkas_devices (
+            device_id INTEGER PRIMARY KEY,
+            fetched_until TEXT
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def money(value):
+    """Сумма ключа в одном формате: 100, 100.0 и '100.00' -> '100.00'"""
+    try:
+        return f"{float(value):.2f}"
+    except (TypeError, ValueError):
+        return str(value if value is not None else '').strip()
+
+
+def card_key(value):
+    """card_id ключа: 14147, 14147.0 и ' 14147' -> '14147'"""
+    text = str(value if value is not None else '').strip()
+    return text[:-2] if text.endswith('.0') else text
+
+
+def fetch_start(conn, device_id, today):
+    """Начало окна запроса для аппарата ('YYYY-MM-DD 00:00:00')"""
+    row = conn.execute("SELECT fetched_until FROM inkas_devices WHERE device_id = ?", (device_id,)).fetchone()
+    if row and row[0]:
+        start = datetime.strptime(row[0][:10], '%Y-%m-%d').date() - timedelta(days=OVERLAP_DAYS)
+    else:
+        start = today - timedelta(weeks=INITIAL_WEEKS)
+    return start.strftime('%Y-%m-%d 00:00:00')
+
+
+def store(conn, device_id, address, items, fetched_until):
+    """
+    Записывает ответ API по аппарату (одна транзакция) и отмечает, до какого момента он опрошен.
+    Одинаковые по ключу строки (в том числе повторенные в одном ответе) хранятся одной записью.
+    Возвращает кол-во новых записей.
+    """
+    rows = [(device_id, address, item.get("date", ""), card_key(item.get("card_id", "")), money(item.get("sum", "")),
+             str(item.get("banknotes", "")), str(item.get("coins", "")), item.get("descr", ""))
+            for item in items]
+    with conn:
+        before = conn.execute("SELECT COUNT(*) FROM inkas WHERE device_id = ?", (device_id,)).fetchone()[0]
+        conn.executemany("""
+            INSERT INTO inkas (device_id, address, date, card_id, sum, banknotes, coins, descr)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(device_id, date, card_id, sum) DO UPDATE SET
+                address = excluded.address, banknotes = excluded.banknotes,
+                coins = excluded.coins, descr = excluded.descr
+        """, rows)
+        after = conn.execute("SELECT COUNT(*) FROM inkas WHERE device_id = ?", (device_id,)).fetchone()[0]
+        conn.execute("""
+            INSERT INTO inkas_devices (device_id, fetched_until) VALUES (?, ?)
+            ON CONFLICT(device_id) DO UPDATE SET fetched_until = excluded.fetched_until
+        """, (device_id, fetched_until))
+    return after - before
+
+
+def query(conn, date_from=None, date_to=None, device_id=None):
+    """Инкассации за период (даты 'YYYY-MM-DD', включительно) — DataFrame в формате inkas5w.csv"""
+    sql = f"SELECT {', '.join(COLUMNS)} FROM inkas WHERE 1 = 1"
+    params = []
+    if date_from:
+        sql += " AND date >= ?"
+        params.append(f"{date_from} 00:00:00")
+    if date_to:
+        sql += " AND date <= ?"
+        params.append(f"{date_to} 23:59:59")
+    if device_id is not None:
+        sql += " AND device_id = ?"
+        params.append(device_id)
+    sql += " ORDER BY device_id, date"
+    return pd.read_sql_query(sql, conn, params=params)
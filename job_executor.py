@@ -0,0 +1,199 @@
+import queue
+import threading
+import itertools
+from collections import deque
+from datetime import datetime
+
+# Очередь тяжелых процессов бота (парсеры с Chrome, пересчеты) на фиксированном пуле потоков.
+# Один вид задачи — один экземпляр: повторный запуск подписывается на уже идущий процесс.
+
+MAX_WORKERS = 2
+HISTORY_SIZE = 10
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'в очереди', 'выполняется', 'готово', 'ошибка', 'отменено'
+
+
+class JobCancelled(BaseException):
+    """
+    Поднимается из progress-колбэка, когда задачу отменили.
+    BaseException — чтобы `except Exception` в этапах не превращал отмену в «ошибку этапа».
+    """
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, func):
+        self.id = next(self._ids)
+        self.kind = kind
+        self.func = func
+        self.status = QUEUED
+        self.created = datetime.now()
+        self.started = None
+        self.finished = None
+        self.last_message = ''
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.subscribers = []
+        self.on_done = []  # вызываются после завершения (досылка последнего статуса и т.п.)
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def attach(self, callback=None, on_done=None):
+        """
+        Добавляет подписчика и on_done, если задача еще активна.
+        Возвращает (finished, last_message): finished=True — задача уже завершена, ничего не добавлено.
+        """
+        with self.lock:
+            finished = not self.active
+            if not finished:
+                if callback:
+                    self.subscribers.append(callback)
+                if on_done:
+                    self.on_done.append(on_done)
+            return finished, self.last_message
+
+    def progress(self, text):
+        """Колбэк, который получает процесс: рассылает статус подписчикам и проверяет отмену"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.kind)
+        self.notify(text)
+
+    def notify(self, text):
+        with self.lock:
+            self.last_message = text
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(text)
+            except Exception:
+                pass
+
+    def describe(self):
+        since = self.started or self.created
+        line = f"#{self.id} {self.kind} — {self.status} ({since.strftime('%H:%M:%S')})"
+        if self.active and self.last_message:
+            line += f"\n   {self.last_message[:100]}"
+        return line
+
+
+class JobExecutor:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.jobs = {}  # kind -> активная задача
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.workers = [threading.Thread(target=self._worker, daemon=True, name=f"job-worker-{i}")
+                        for i in range(max_workers)]
+        for w in self.workers:
+            w.start()
+
+    def submit(self, kind, func, subscriber=None, on_done=None):
+        """
+        Ставит func(progress) в очередь. Если такой вид задачи уже идет —
+        подписывает subscriber (и on_done) на нее. Возвращает (job, attached).
+        """
+        with self.lock:
+            job = self.jobs.get(kind)
+            attached = job is not None and job.active
+            if not attached:
+                job = Job(kind, func)
+                self.jobs[kind] = job
+            # Подписка под тем же замком, под которым задача завершается (_finish):
+            # воркер не может закончить ее и вызвать on_done раньше, чем подписчик добавлен
+            finished, last = job.attach(subscriber, on_done)
+            if not attached:
+                self.queue.put(job)
+        if subscriber and last:
+            subscriber(last)
+        if finished and on_done:
+            # Уже завершилась: досылаем последний статус и закрываем сразу
+            on_done()
+        return job, attached
+
+    def cancel(self, kind):
+        """Отмена: из очереди — сразу, выполняющаяся — на ближайшем сообщении о прогрессе"""
+        with self.lock:
+            job = self.jobs.get(kind)
+            if not job or not job.active:
+                return None
+            job.cancel_event.set()
+            queued = job.status == QUEUED
+            if queued:
+                self._finish(job, CANCELLED)
+        if queued:
+            self._run_on_done(job)
+        return job
+
+    def status(self):
+        with self.lock:
+            active = [j for j in self.jobs.values() if j.active]
+            recent = list(self.history)
+        return active, recent
+
+    def busy(self):
+        """Все потоки пула заняты — новая задача будет ждать"""
+        with self.lock:
+            running = sum(1 for j in self.jobs.values() if j.status == RUNNING)
+        return running >= len(self.workers)
+
+    def status_text(self):
+        active, recent = self.status()
+        lines = ["⚙️ ПРОЦЕССЫ"]
+        lines += [j.describe() for j in sorted(active, key=lambda j: j.id)] or ["Сейчас ничего не выполняется."]
+        if recent:
+            lines += ["", "Последние:"] + [j.describe() for j in reversed(recent)]
+        return "\n".join(lines)
+
+    def _finish(self, job, status, error=None):
+        # Вызывать под self.lock
+        job.status = status
+        job.error = error
+        job.finished = datetime.now()
+        if self.jobs.get(job.kind) is job:
+            del self.jobs[job.kind]
+        self.history.append(job)
+
+    def _run_on_done(self, job):
+        with job.lock:
+            callbacks = list(job.on_done)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                if job.status != QUEUED:  # отменена, пока ждала
+                    continue
+                job.status = RUNNING
+                job.started = datetime.now()
+            try:
+                job.func(job.progress)
+                result, error = DONE, None
+            except JobCancelled:
+                result, error = CANCELLED, None
+                job.notify(f"⛔ {job.kind}: процесс отменен")
+            except Exception as e:
+                result, error = FAILED, e
+            with self.lock:
+                self._finish(job, result, error)
+            self._run_on_done(job)
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = JobExecutor()
+        return _EXECUTOR
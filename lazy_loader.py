@@ -0,0 +1,128 @@
+import sys
+import time
+import importlib
+import threading
+
+# Отложенный импорт модулей ролей и конвейеров: pandas, numpy, selenium, folium и т.п.
+# грузятся при первом обращении к модулю (или в фоновом прогреве), а не при старте бота.
+# Техник, который только смотрит свои задачи, не тянет за собой парсеры админа.
+
+
+class LazyModule:
+    """
+    Заместитель модуля: import выполняется при первом обращении к атрибуту.
+    bool(lazy) — модуль импортируется без ошибок (замена проверки `if not parse_work`).
+    """
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._module = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None and self._error is None:
+            with self._lock:
+                if self._module is None and self._error is None:
+                    try:
+                        self._module = importlib.import_module(self.__name__)
+                    except ImportError as e:
+                        self._error = e
+                        print(f"⚠️ Ошибка импорта {self.__name__}: {e}")
+        if self._error is not None:
+            raise ImportError(self._error)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __bool__(self):
+        try:
+            self.load()
+            return True
+        except ImportError:
+            return False
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = 'загружен' if self._module is not None else 'не загружен'
+        return f"<LazyModule {self.__name__} ({state})>"
+
+
+def lazy(name):
+    return LazyModule(name)
+
+
+def preload(*modules):
+    """Прогрев в фоне: модули импортируются по очереди, ошибки только логируются"""
+    def run():
+        for module in modules:
+            try:
+                module.load()
+            except ImportError:
+                pass
+
+    thread = threading.Thread(target=run, daemon=True, name="module-preload")
+    thread.start()
+    return thread
+
+
+# --- Замер старта: python lazy_loader.py ---
+# Меряется настоящий старт бота — import tbot со всей цепочкой (telebot, chat_dispatcher,
+# session_store -> utils -> device_directory/create_db/task_stats) — и он же с ролями и конвейерами сразу
+ROLE_MODULES = ['ruslan', 'dmutro', 'igor', 'calcentr', 'admin']
+PIPELINE_MODULES = ['parse_work', 'parse_ink', 'parse_service', 'route_planner', 'all_zadaci']
+
+_BENCH_TBOT = """
+import os
+os.environ.setdefault('TOKEN', '0:benchmark')
+import tbot
+"""
+
+_BENCH_EAGER = """
+for name in {modules!r}:
+    try:
+        __import__(name)
+    except ImportError:
+        pass
+"""
+
+_BENCH_RSS = """
+import resource, sys
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def benchmark(repeat=3):
+    """Время и пик памяти процесса на старт бота: роли импортируются сразу (как было) и отложенно"""
+    import os
+    import subprocess
+    import tempfile
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')])))
+    results = {}
+    for label, modules in [
+        ("Старт бота, роли и конвейеры сразу", ROLE_MODULES + PIPELINE_MODULES),
+        ("Старт бота, роли отложенно", []),
+        ("Старт бота + роль техника при первом входе", ['ruslan']),
+    ]:
+        code = _BENCH_TBOT + _BENCH_EAGER.format(modules=modules) + _BENCH_RSS
+        times, rss = [], 0
+        for _ in range(repeat):
+            # Чужой рабочий каталог: tbot при импорте перезаписывает bot_log.log
+            with tempfile.TemporaryDirectory() as cwd:
+                started = time.perf_counter()
+                proc = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env,
+                                      check=True, capture_output=True, text=True)
+                times.append(time.perf_counter() - started)
+            rss = int(proc.stderr.strip().splitlines()[-1])
+        results[label] = (min(times), rss)
+        print(f"{label}: {min(times) * 1000:.0f} мс, пик RSS {rss / 1024:.1f} МБ")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,125 @@
+import json
+
+# Легкая карта маршрутов: Leaflet + MarkerCluster с CDN, все данные — один JSON-блок.
+# Слой на каждый день (переключаются в контроле слоев), внутри — GeoJSON FeatureCollection
+# на техника/день; маркеры и попапы создаются в браузере.
+
+MAP_CENTER = (49.8397, 24.0297)
+COORD_DIGITS = 5  # ~1 м, больше для карты не нужно
+
+TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Маршруты техников</title>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.4/dist/leaflet.css">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet.markercluster@1.5.3/dist/MarkerCluster.css">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css">
+<script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js"></script>
+<style>
+html,body,#map{height:100%;margin:0}
+.num{font-size:12px;font-weight:bold}
+.legend{background:#fff;padding:8px;border:1px solid #ccc;font-size:12px}
+.legend span{display:inline-block;width:12px;height:12px;margin-right:6px}
+</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var DATA = __DATA__;
+var map = L.map('map').setView(__CENTER__, 12);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {maxZoom: 19, attribution: '&copy; OpenStreetMap'}).addTo(map);
+
+function esc(s) {
+  return String(s).replace(/[&<>"]/g, function (c) { return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c]; });
+}
+
+var overlays = {};
+var dates = Object.keys(DATA.days).sort();
+dates.forEach(function (date, di) {
+  var layer = L.layerGroup();
+  var cluster = L.markerClusterGroup({disableClusteringAtZoom: 16, showCoverageOnHover: false});
+  DATA.days[date].forEach(function (fc) {
+    var tech = fc.properties.tech, color = DATA.techs[tech];
+    fc.features.forEach(function (f) {
+      var c = f.geometry.coordinates;
+      if (f.geometry.type === 'LineString') {
+        L.polyline(c.map(function (p) { return [p[1], p[0]]; }), {color: color, weight: 4, opacity: 0.8}).addTo(layer);
+        return;
+      }
+      var p = f.properties;
+      var icon = L.divIcon({className: '', iconSize: [30, 12], iconAnchor: [15, 12],
+                            html: '<div class="num" style="color:' + color + '">' + p.n + '</div>'});
+      cluster.addLayer(L.marker([c[1], c[0]], {icon: icon}).bindPopup(function () {
+        var html = '<b>' + p.n + '. ' + esc(DATA.addrs[p.a]) + '</b><br><b>' + esc(tech) + '</b> — ' + date + '<br>';
+        if (p.s) html += '⏰ ' + p.s + ' ';
+        if (p.e) html += '→ ' + p.e;
+        return html;
+      }));
+    });
+  });
+  layer.addLayer(cluster);
+  overlays[date] = layer;
+  if (di === dates.length - 1) layer.addTo(map);
+});
+L.control.layers(null, overlays, {collapsed: true}).addTo(map);
+
+var legend = L.control({position: 'bottomleft'});
+legend.onAdd = function () {
+  var div = L.DomUtil.create('div', 'legend'), html = '<b>Техники</b>';
+  Object.keys(DATA.techs).forEach(function (t) {
+    html += '<div style="margin-top:4px"><span style="background:' + DATA.techs[t] + '"></span>' + esc(t) + '</div>';
+  });
+  div.innerHTML = html;
+  return div;
+};
+if (Object.keys(DATA.techs).length) legend.addTo(map);
+</script>
+</body>
+</html>
+"""
+
+
+class RouteMapBuilder:
+    """Собирает маршруты в компактный JSON (адреса — общим справочником) и пишет HTML"""
+
+    def __init__(self):
+        self.days = {}
+        self.techs = {}
+        self.addrs = []
+        self.addr_index = {}
+
+    def _addr(self, addr):
+        if addr not in self.addr_index:
+            self.addr_index[addr] = len(self.addrs)
+            self.addrs.append(addr)
+        return self.addr_index[addr]
+
+    def add_route(self, date, tech, color, points, km):
+        """points: [(addr, lat, lon, start, end)] в порядке объезда"""
+        self.techs.setdefault(tech, color)
+        line = [[round(lon, COORD_DIGITS), round(lat, COORD_DIGITS)] for _, lat, lon, _, _ in points]
+        features = [{"type": "Feature", "geometry": {"type": "LineString", "coordinates": line}, "properties": {}}]
+        for i, (addr, lat, lon, st, en) in enumerate(points, 1):
+            props = {"n": i, "a": self._addr(addr)}
+            if st is not None: props["s"] = str(st)
+            if en is not None: props["e"] = str(en)
+            features.append({"type": "Feature", "properties": props,
+                             "geometry": {"type": "Point", "coordinates": line[i - 1]}})
+        self.days.setdefault(str(date), []).append({
+            "type": "FeatureCollection",
+            "properties": {"tech": tech, "km": round(km, 3)},
+            "features": features,
+        })
+
+    def to_json(self):
+        data = {"techs": self.techs, "addrs": self.addrs, "days": self.days}
+        # '</' внутри <script> закрыл бы тег
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+    def save(self, path, center=MAP_CENTER):
+        html = TEMPLATE.replace("__CENTER__", json.dumps(list(center))).replace("__DATA__", self.to_json())
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
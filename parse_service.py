@@ -2,19 +2,20 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
-import requests
-import time
 import re
-import json
-import subprocess
-import sys
 import io
 import os
 from pathlib import Path
 from datetime import datetime, timedelta
-from math import radians, sin, cos, asin, sqrt
-import folium
-from folium.features import DivIcon
+
+import service_log
+import service_visits
+import device_directory
+import geocache
+import device_coords
+import geo
+import map_render
+import route_cache
 
 # ======================== КЛАСС ЛОГГЕРА ========================
 
@@ -34,113 +35,36 @@ class StringLogger:
 
 # ======================== ФУНКЦИОНАЛ (БЕЗ ИЗМЕНЕНИЙ ЛОГИКИ) ========================
 
-def clean_datetime(val):
-    if val is None: return None
-    s = str(val).strip().replace("*", " ").strip()
-    s = re.sub(r"[^0-9:\- ]", "", s).strip()
-    if s == "": return None
-    formats = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
-    for fmt in formats:
-        try: return datetime.strptime(s, fmt)
-        except: pass
-    try: return pd.to_datetime(s, errors="coerce")
-    except: return None
+OUT_ANALITIK = service_visits.OUT_ANALITIK
 
 def process_service_data(logger):
-    """Stage 11"""
+    """Stage 11: визиты и таблицы техников одним проходом (только дни, затронутые новыми событиями)"""
     logger.log("🔄 [Stage 11] Обработка сырых данных...")
     if not os.path.exists("service_mes.csv"):
         logger.log("❌ Файл service_mes.csv не найден!")
         return False
 
+    since = service_log.get_pending_since("stage11")
+    if not os.path.exists(OUT_ANALITIK):
+        since = ""
+    elif since is None:
+        logger.log("ℹ️ Новых событий нет — service_tex_analitik.csv актуален.")
+        return True
+    logger.log(f"📅 Пересчет с {since}" if since else "📅 Полный пересчет")
+
     try:
-        df = pd.read_csv("service_mes.csv", header=None)
-        # Попытка определить структуру, предполагаем 3 колонки
-        if len(df.columns) < 3:
-             # Если заголовки есть
-             df = pd.read_csv("service_mes.csv")
-        
-        # Принудительно именуем
-        df.columns = ["datetime", "event", "aparat"]
-        
-        df["datetime"] = df["datetime"].apply(clean_datetime)
-        df = df.dropna(subset=["datetime"])
-        df["is_on"] = df["event"].astype(str).str.contains("Service ON", na=False)
-        df["is_off"] = df["event"].astype(str).str.contains("Service OFF", na=False)
-        df["tech"] = df["event"].astype(str).str.extract(r"Service ON - (.+)")
-        df = df.sort_values("datetime")
-        
-        records = []
-        for aparat, group in df.groupby("aparat"):
-            group = group.sort_values("datetime")
-            current_on = None
-            current_tech = None
-            for _, row in group.iterrows():
-                if row["is_on"]:
-                    current_on = row["datetime"]
-                    current_tech = row["tech"]
-                elif row["is_off"] and current_on is not None:
-                    start = current_on
-                    end = row["datetime"]
-                    kol_time = int((end - start).total_seconds() // 60)
-                    records.append({
-                        "data": start.date(), "aparat": aparat, "start": start.time(),
-                        "tech": current_tech, "end": end.time(), "kol-time": kol_time,
-                        "v_doroge": 0, "fir_point": "", "last_point": ""
-                    })
-                    current_on = None
-                    current_tech = None
-        
-        out = pd.DataFrame(records)
-        if out.empty:
-            logger.log("⚠️ Данные отсутствуют — таблица пуста.")
-            return True # Не ошибка, просто пусто
-            
-        out = out.sort_values(["data", "tech", "start"])
-        
-        # Расчет времени в дороге
-        for tech, group in out.groupby("tech"):
-            prev = None
-            for idx, row in group.iterrows():
-                if prev is not None:
-                    t1 = datetime.combine(row["data"], row["start"])
-                    t0 = datetime.combine(prev["data"], prev["end"])
-                    diff = (t1 - t0).total_seconds() // 60
-                    out.loc[idx, "v_doroge"] = int(diff)
-                prev = row
-                
-        # Отметки точек
-        out["fir_point"] = ""
-        out["last_point"] = ""
-        for (tech, day), group in out.groupby(["tech", "data"]):
-            group = group.sort_values("start")
-            if not group.empty:
-                out.loc[group.index[0], "fir_point"] = "YES"
-                out.loc[group.index[-1], "last_point"] = "YES"
-                
-        out.to_csv("service_tex_analitik.csv", index=False, encoding="utf-8-sig")
-        logger.log("✅ Stage 11 завершен. Файл: service_tex_analitik.csv")
+        service_visits.build_outputs(since, log=logger.log)
+        service_log.mark_processed("stage11")
+        logger.log(f"✅ Stage 11 завершен. Файл: {OUT_ANALITIK}")
         return True
     except Exception as e:
         logger.log(f"❌ Ошибка в Stage 11: {e}")
         return False
 
 # --- Функции для карт ---
-CACHE_FILE = "address_cache.json"
 OUT_HTML = "interactive_routes_map.html"
 OUT_SUMMARY = "service_routes_summary.csv"
-
-def load_cache():
-    if Path(CACHE_FILE).exists():
-        try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except: return {}
-    return {}
-
-def save_cache(cache):
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+GEOCODE_WAIT_SECONDS = 30  # сколько ждать сетевой геокодер, остальное дорешается в фоне
 
 def clean_address(raw):
     if pd.isna(raw): return ""
@@ -157,131 +81,121 @@ def clean_address(raw):
 
 def normalize_for_cache(addr):
     a = addr.lower().strip()
-    a = re.sub(r"вул\.|вулиця|улица|ул\.|проспект|пр\.|буд\.|будинок", "", a)
+    a = re.sub(device_directory.STREET_WORDS, "", a)
     a = re.sub(r"\s+", " ", a).strip()
     return a
 
-def geocode_nominatim(address, cache, logger, city_hint="Львів"):
-    if not address: return None, None
-    norm = normalize_for_cache(address)
-    if norm in cache:
-        v = cache[norm]
-        return v.get("lat"), v.get("lon")
-    
-    q = f"{city_hint} {address}"
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {"q": q, "format": "json", "limit": 1, "addressdetails": 0}
-    try:
-        resp = requests.get(url, params=params, headers={"User-Agent": "WaterRoutesBot/1.0"}, timeout=10)
-        data = resp.json()
-    except:
-        return None, None
-        
-    if not data:
-        cache[norm] = {"lat": None, "lon": None}
-        logger.log(f"✖ Не найдено: '{address}'")
-        time.sleep(1.0)
-        return None, None
-        
-    lat, lon = float(data[0]["lat"]), float(data[0]["lon"])
-    cache[norm] = {"lat": lat, "lon": lon}
-    logger.log(f"✓ Геокод: '{address}'")
-    time.sleep(1.0)
-    return lat, lon
+def geocode_service_addresses(logger):
+    """Stage 11G: таблица координат аппаратов + геокодирование того, чего в ней нет"""
+    logger.log("\n📍 [Stage 11G] Координаты аппаратов...")
+    if not Path(OUT_ANALITIK).exists():
+        logger.log(f"❗ Файл {OUT_ANALITIK} не найден.")
+        return False
+
+    aparats = pd.read_csv(OUT_ANALITIK, dtype=str, usecols=["aparat"])["aparat"].dropna().unique()
+    new_devices = device_coords.sync_devices(clean_address, normalize_for_cache)
+    new_names = device_coords.register_names(aparats, clean_address, normalize_for_cache)
+    logger.log(f"📋 Новых аппаратов: {new_devices}, новых вариантов адреса: {new_names}")
+
+    addresses = device_coords.unresolved(aparats)
+    if addresses:
+        stats = geocache.resolve_addresses(addresses, log=logger.log, wait_seconds=GEOCODE_WAIT_SECONDS)
+        device_coords.refresh_from_geocache()
+        logger.log(f"✅ Без координат: {stats['total']}, из кеша: {stats['cached']}, "
+                   f"в сеть: {stats['queued']}, ещё в очереди: {stats['left']}")
+    else:
+        logger.log("✅ Координаты есть для всех аппаратов")
+    return True
+
+ROUTE_COLORS = ["red", "blue", "green", "purple", "orange", "darkred", "cadetblue", "darkblue", "darkgreen"]
+
+def parse_time(s):
+    if pd.isna(s): return None
+    s = str(s).strip()
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try: return pd.to_datetime(s, format=fmt).time()
+        except: pass
+    return None
+
+def build_day_routes(day_df):
+    """Маршруты одного дня: [{tech, points, km, aparats}] — то, что кладется в route_cache"""
+    day_df = day_df.copy()
+    day_df["start_t"] = day_df["start"].apply(parse_time)
+    day_df["end_t"] = day_df["end"].apply(parse_time)
+    day_df = day_df.sort_values(["tech", "start_t"])
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    return R * 2 * asin(sqrt(a))
+    # Километраж всех маршрутов дня одним проходом (точки без координат пропускаются)
+    km_by_tech = geo.route_km(day_df.dropna(subset=["lat"]), ["tech"])
+
+    routes = []
+    for tech, grp in day_df.groupby("tech", sort=True):
+        if str(tech).strip() == "nan": continue
+
+        points, aparats = [], []
+        for _, r in grp.iterrows():
+            if pd.isna(r["lat"]): continue
+            st = str(r["start_t"]) if pd.notna(r["start_t"]) else None
+            en = str(r["end_t"]) if pd.notna(r["end_t"]) else None
+            points.append([r["addr"], float(r["lat"]), float(r["lon"]), st, en])
+            # Один аппарат — одна точка, даже если текст его адреса менялся
+            key = int(r["device_id"]) if pd.notna(r["device_id"]) else r["addr"]
+            if key not in aparats: aparats.append(key)
+
+        if not points: continue
+        routes.append({"tech": str(tech).strip(), "points": points,
+                       "km": float(km_by_tech.get(tech, 0.0)), "aparats": len(aparats)})
+    return routes
 
 def build_routes_map(logger):
     """Stage 11A & 11B"""
     logger.log("\n🗺️  [Stage 11A/B] Построение маршрутов...")
-    if not Path("service_tex_analitik.csv").exists():
-        logger.log("❗ Файл service_tex_analitik.csv не найден.")
+    if not Path(OUT_ANALITIK).exists():
+        logger.log(f"❗ Файл {OUT_ANALITIK} не найден.")
         return False
         
-    df = pd.read_csv("service_tex_analitik.csv", dtype=str)
+    df = pd.read_csv(OUT_ANALITIK, dtype=str)
     if df.empty: return True
 
     df.columns = [c.strip() for c in df.columns]
-    df["data"] = pd.to_datetime(df["data"], errors="coerce").dt.date
-    
-    def parse_time(s):
-        if pd.isna(s): return None
-        s = str(s).strip()
-        for fmt in ("%H:%M:%S", "%H:%M"):
-            try: return pd.to_datetime(s, format=fmt).time()
-            except: pass
-        return None
-        
-    df["start_t"] = df["start"].apply(parse_time)
-    df["end_t"] = df["end"].apply(parse_time)
-    
-    cache = load_cache()
-    # Группировка
-    try:
-        grouped = df.sort_values(["data", "tech", "start_t"]).groupby(["data", "tech"], sort=True)
-    except KeyError:
+    if not {"data", "tech", "aparat", "start", "end"}.issubset(df.columns):
         logger.log("❌ Ошибка структуры CSV файла.")
         return False
+    df["data"] = pd.to_datetime(df["data"], errors="coerce").dt.date
+    df = df.dropna(subset=["data"])
+    df["day"] = df["data"].astype(str)
+    
+    # Координаты — join по тексту аппарата с таблицей аппаратов (сеть не трогаем — это Stage 11G)
+    names = df["aparat"].dropna().unique()
+    device_coords.register_names(names, clean_address, normalize_for_cache)
+    df = df.merge(device_coords.lookup(names), on="aparat", how="left")
+
+    # Хеш дня — по строкам и найденным координатам: догеокодированный адрес тоже пересчитает день
+    hashes = route_cache.day_hashes(df, "day", ["tech", "aparat", "start", "end", "device_id", "lat", "lon"])
+    cached = route_cache.load(hashes)
+    changed = [d for d, h in hashes.items() if cached.get(d, (None,))[0] != h]
 
-    fmap = folium.Map(location=[49.8397, 24.0297], zoom_start=12)
-    colors = ["red", "blue", "green", "purple", "orange", "darkred", "cadetblue", "darkblue", "darkgreen"]
+    fresh = {}
+    for day, day_df in df[df["day"].isin(changed)].groupby("day"):
+        fresh[day] = (hashes[day], build_day_routes(day_df))
+    route_cache.store(fresh)
+    route_cache.prune(hashes)
+    logger.log(f"   Дней: {len(hashes)}, пересчитано: {len(fresh)}, из кеша: {len(hashes) - len(fresh)}")
+
+    # Сборка карты и сводки из готовых дней
+    builder = map_render.RouteMapBuilder()
     tech_colors = {}
     summary = []
+    for day in sorted(hashes):
+        routes = fresh[day][1] if day in fresh else cached[day][1]
+        for route in routes:
+            tk = route["tech"]
+            if tk not in tech_colors:
+                tech_colors[tk] = ROUTE_COLORS[len(tech_colors) % len(ROUTE_COLORS)]
+            builder.add_route(day, tk, tech_colors[tk], route["points"], route["km"])
+            summary.append({"date": day, "tech": tk, "aparats": route["aparats"],
+                            "km": round(route["km"], 3), "points": len(route["points"])})
     
-    for (date, tech), grp in grouped:
-        if pd.isna(date) or str(tech).strip() == "nan": continue
-        
-        coords, points, aparats = [], [], []
-        for _, r in grp.iterrows():
-            addr = clean_address(r["aparat"])
-            lat, lon = geocode_nominatim(addr, cache, logger)
-            if lat is None: continue
-            
-            coords.append((lat, lon))
-            points.append((addr, lat, lon, r["start_t"], r["end_t"]))
-            if addr not in aparats: aparats.append(addr)
-            
-        if not coords: continue
-        
-        tk = str(tech).strip()
-        if tk not in tech_colors:
-            tech_colors[tk] = colors[len(tech_colors) % len(colors)]
-        col = tech_colors[tk]
-        
-        folium.PolyLine(coords, color=col, weight=4, opacity=0.8).add_to(fmap)
-        
-        km = sum(haversine_km(*coords[i], *coords[i+1]) for i in range(len(coords)-1))
-        
-        for i, (addr, lat, lon, st, en) in enumerate(points, 1):
-            popup = f"<b>{i}. {addr}</b><br><b>{tk}</b> — {date}<br>"
-            if pd.notna(st): popup += f"⏰ {st} "
-            if pd.notna(en): popup += f"→ {en}"
-            
-            folium.Marker(
-                [lat, lon], 
-                icon=DivIcon(
-                    icon_size=(30,12), icon_anchor=(15,12),
-                    html=f'<div style="font-size:12px;font-weight:bold;color:{col}">{i}</div>'
-                ), 
-                popup=popup
-            ).add_to(fmap)
-            
-        summary.append({"date": str(date), "tech": tk, "aparats": len(aparats), "km": round(km, 3), "points": len(points)})
-    
-    # Легенда
-    if tech_colors:
-        leg = '<div style="position:fixed;bottom:50px;left:10px;z-index:9999;background:#fff;padding:8px;border:1px solid #ccc;font-size:12px;"><b>Техники</b><br>'
-        for t, c in tech_colors.items():
-            leg += f'<div style="margin-top:4px;"><span style="display:inline-block;width:12px;height:12px;background:{c};margin-right:6px;"></span>{t}</div>'
-        leg += "</div>"
-        fmap.get_root().html.add_child(folium.Element(leg))
-        
-    save_cache(cache)
-    fmap.save(OUT_HTML)
+    builder.save(OUT_HTML)
     logger.log(f"✅ Карта создана: {OUT_HTML}")
     
     if summary:
@@ -289,30 +203,6 @@ def build_routes_map(logger):
     
     return True
 
-def run_process_service_data_script(logger):
-    """Запускает process_service_data.py если он есть как отдельный скрипт"""
-    logger.log("\n🔧 [Stage 12] Запуск process_service_data.py...")
-    
-    script_path = Path("process_service_data.py")
-    if not script_path.exists():
-        logger.log(f"ℹ️ Файл {script_path} не найден, пропускаем этот шаг.")
-        return True
-    
-    try:
-        result = subprocess.run(
-            [sys.executable, str(script_path)],
-            capture_output=True,
-            text=True,
-            encoding="utf-8"
-        )
-        logger.log(result.stdout)
-        if result.stderr:
-            logger.log(f"Stderr: {result.stderr}")
-        return True
-    except Exception as e:
-        logger.log(f"❌ Ошибка запуска скрипта: {e}")
-        return False
-
 # ======================== ГЛАВНАЯ ФУНКЦИЯ ЗАПУСКА ========================
 
 def run_full_cycle(callback=None):
@@ -338,16 +228,18 @@ def run_full_cycle(callback=None):
              update_status("❌ Ошибка на этапе 1")
              return False
         
+        # Stage 11G
+        update_status("⏳ [2/3] Геокодирование адресов...")
+        if not geocode_service_addresses(logger):
+             update_status("❌ Ошибка на этапе геокодирования")
+             return False
+        
         # Stage 11A & 11B
-        update_status("⏳ [2/3] Построение карты и маршрутов...")
+        update_status("⏳ [3/3] Построение карты и маршрутов...")
         if not build_routes_map(logger):
              update_status("❌ Ошибка на этапе карты")
              return False
         
-        # Stage 12 (Optional script)
-        update_status("⏳ [3/3] Финализация...")
-        run_process_service_data_script(logger)
-        
         update_status("✅ Все этапы успешно завершены!")
         return True
         
@@ -0,0 +1,58 @@
+import time
+import threading
+
+# Прогресс процессов в Telegram: этапы вызывают update() сколько угодно раз,
+# в чат уходит не больше одного edit_message_text за INTERVAL секунд и всегда — последний текст.
+# Отправка идет из отдельного потока, этап на HTTP не ждет.
+
+INTERVAL = 3.0
+
+
+class ThrottledReporter:
+    def __init__(self, send, interval=INTERVAL):
+        self.send = send
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()    # есть новый текст
+        self.stopping = threading.Event()  # close(): больше не ждать окна
+        self.pending = None                # последний еще не отправленный текст
+        self.thread = threading.Thread(target=self._loop, daemon=True, name="progress-reporter")
+        self.thread.start()
+
+    def update(self, text):
+        """Не блокирует: запоминает текст, предыдущий неотправленный просто заменяется"""
+        if self.stopping.is_set():
+            return
+        with self.lock:
+            self.pending = text
+        self.wakeup.set()
+
+    def close(self, timeout=None):
+        """Дослать последнее состояние и остановить поток"""
+        self.stopping.set()
+        self.wakeup.set()
+        if threading.current_thread() is not self.thread:
+            self.thread.join(timeout)
+
+    def _loop(self):
+        last_sent = None
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            # Ждем следующего разрешенного окна; обновления за это время склеиваются
+            if last_sent is not None:
+                delay = last_sent + self.interval - time.monotonic()
+                if delay > 0:
+                    self.stopping.wait(delay)
+            with self.lock:
+                text, self.pending = self.pending, None
+            if text is not None:
+                try:
+                    self.send(text)
+                except Exception:
+                    pass
+                last_sent = time.monotonic()
+            if self.stopping.is_set():
+                with self.lock:
+                    if self.pending is None:
+                        return
@@ -0,0 +1,149 @@
+import os
+import glob
+import zipfile
+import threading
+
+import document_cache
+
+# Доставка больших отчетов в Telegram: формат выбирается по типу и размеру файла.
+#   текст (txt, csv, html, json) до RAW_LIMIT — как есть, больше — в zip (открывается на телефоне);
+#   zip больше MAX_PART: csv/txt режутся по строкам на самостоятельные части, остальное — на куски .001, .002;
+#   уже сжатое (xlsx, gz, zip) не пережимается, только режется, если не влезает в лимит.
+# Готовые части лежат в OUTBOX и пересобираются только при изменении исходника,
+# zip детерминированный — неизменившийся отчет уходит по file_id (document_cache).
+
+MAX_PART = 45 * 1024 * 1024   # лимит Bot API на документ — 50 МБ, с запасом
+RAW_LIMIT = 512 * 1024
+OUTBOX = 'outbox'
+
+TEXT_EXT = {'.txt', '.csv', '.html', '.json'}
+LINE_SPLIT_EXT = {'.txt', '.csv'}
+ZIP_DATE = (2020, 1, 1, 0, 0, 0)  # фиксированная дата в архиве: тот же исходник — те же байты
+
+_lock = threading.Lock()
+_prepared = {}  # path -> (mtime_ns, size, [части])
+
+
+def _zip(src_path, zip_path, arcname):
+    info = zipfile.ZipInfo(arcname, ZIP_DATE)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(zip_path, 'w') as zf, open(src_path, 'rb') as src, zf.open(info, 'w') as dst:
+        for block in iter(lambda: src.read(1 << 20), b''):
+            dst.write(block)
+    return zip_path
+
+
+def _split_bytes(path, base):
+    parts = []
+    with open(path, 'rb') as f:
+        for i, chunk in enumerate(iter(lambda: f.read(MAX_PART), b''), 1):
+            part = f"{base}.{i:03d}"
+            with open(part, 'wb') as out:
+                out.write(chunk)
+            parts.append(part)
+    return parts
+
+
+def _split_lines(path, base, ext, chunk_bytes):
+    """Текст по строкам на куски ~chunk_bytes, каждый — отдельный zip; у csv повторяется заголовок"""
+    name = os.path.basename(base)
+    parts = []
+    with open(path, 'rb') as f:
+        header = f.readline() if ext == '.csv' else b''
+        if ext != '.csv':
+            f.seek(0)
+        head = [header] if header else []
+        chunk, size = [], len(header)
+        for line in f:
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_bytes:
+                _write_text_parts(base, name, ext, head, chunk, parts)
+                chunk, size = [], len(header)
+        if chunk:
+            _write_text_parts(base, name, ext, head, chunk, parts)
+    return parts
+
+
+def _write_text_parts(base, name, ext, head, lines, parts):
+    """
+    Кусок строк -> zip-часть (добавляется в parts).
+    chunk_bytes — оценка по сжатию всего файла: плохо сжимающийся кусок может не влезть в MAX_PART,
+    тогда он делится пополам; одна строка больше лимита — режется на куски .001.
+    """
+    num = len(parts) + 1
+    text_path = f"{base}.part{num}{ext}"
+    with open(text_path, 'wb') as out:
+        out.writelines(head + lines)
+    part = _zip(text_path, f"{base}.part{num}.zip", f"{name}.part{num}{ext}")
+    os.remove(text_path)
+    if os.path.getsize(part) <= MAX_PART:
+        parts.append(part)
+    elif len(lines) > 1:
+        os.remove(part)
+        middle = len(lines) // 2
+        _write_text_parts(base, name, ext, head, lines[:middle], parts)
+        _write_text_parts(base, name, ext, head, lines[middle:], parts)
+    else:
+        parts.extend(_split_bytes(part, part))
+        os.remove(part)
+
+
+def discard(path):
+    """Удалить подготовленные части (для разовых выгрузок)"""
+    base = os.path.join(OUTBOX, os.path.basename(path))
+    for old in glob.glob(glob.escape(base) + '.*'):
+        os.remove(old)
+    with _lock:
+        _prepared.pop(path, None)
+
+
+def prepare(path):
+    """Список файлов к отправке (сам path, zip или части)"""
+    st = os.stat(path)
+    with _lock:
+        cached = _prepared.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size) and all(os.path.exists(p) for p in cached[2]):
+        return cached[2]
+
+    ext = os.path.splitext(path)[1].lower()
+    if not (ext in TEXT_EXT and st.st_size > RAW_LIMIT) and st.st_size <= MAX_PART:
+        return [path]
+
+    discard(path)
+    os.makedirs(OUTBOX, exist_ok=True)
+    base = os.path.join(OUTBOX, os.path.basename(path))
+    if ext in TEXT_EXT:
+        zip_path = _zip(path, base + '.zip', os.path.basename(path))
+        zip_size = os.path.getsize(zip_path)
+        if zip_size <= MAX_PART:
+            parts = [zip_path]
+        elif ext in LINE_SPLIT_EXT:
+            # Сколько исходного текста влезает в одну часть — по степени сжатия всего файла
+            chunk_bytes = int(MAX_PART * 0.8 * st.st_size / zip_size)
+            os.remove(zip_path)
+            parts = _split_lines(path, base, ext, chunk_bytes)
+        else:
+            parts = _split_bytes(zip_path, zip_path)
+            os.remove(zip_path)
+    else:
+        parts = _split_bytes(path, base)
+
+    with _lock:
+        _prepared[path] = (st.st_mtime_ns, st.st_size, parts)
+    return parts
+
+
+def deliver(bot, chat_id, path, caption=None):
+    """Отправляет отчет в подходящем формате; возвращает кол-во отправленных файлов"""
+    parts = prepare(path)
+    if len(parts) == 1:
+        document_cache.send_document(bot, chat_id, parts[0], caption=caption)
+        return 1
+    hint = "части открыть в 7-Zip с первой" if parts[0].endswith('.001') else "каждая часть — отдельный архив"
+    for i, part in enumerate(parts, 1):
+        part_caption = f"{caption} (часть {i}/{len(parts)})" if caption else f"Часть {i}/{len(parts)}"
+        if i == 1:
+            part_caption += f"\n{hint}"
+        document_cache.send_document(bot, chat_id, part, caption=part_caption)
+    return len(parts)
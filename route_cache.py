@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import hashlib
+
+import pandas as pd
+
+ROUTE_CACHE_DB = 'route_cache.db'
+CACHE_VERSION = '1'  # менять при изменении формата payload — старые дни пересчитаются
+
+
+def _connect():
+    conn = sqlite3.connect(ROUTE_CACHE_DB)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS route_days (
+            day TEXT PRIMARY KEY,
+            hash TEXT,
+            payload TEXT
+        )
+    """)
+    return conn
+
+
+def day_hashes(df, day_col, cols):
+    """Хеш строк каждого дня (векторно): {day: sha1}. Порядок строк внутри дня учитывается."""
+    hv = pd.util.hash_pandas_object(df[cols].astype(str), index=False).to_numpy()
+    days = df[day_col].astype(str).to_numpy()
+    result = {}
+    for day, idx in pd.Series(range(len(df))).groupby(days).groups.items():
+        h = hashlib.sha1(CACHE_VERSION.encode())
+        h.update(hv[list(idx)].tobytes())
+        result[day] = h.hexdigest()
+    return result
+
+
+def load(days):
+    """{day: (hash, payload)} для дней из кеша"""
+    days = list(days)
+    found = {}
+    conn = _connect()
+    try:
+        for i in range(0, len(days), 500):
+            chunk = days[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            for day, h, payload in conn.execute(
+                    f"SELECT day, hash, payload FROM route_days WHERE day IN ({marks})", chunk):
+                found[day] = (h, json.loads(payload))
+    finally:
+        conn.close()
+    return found
+
+
+def store(items):
+    """items: {day: (hash, payload)}"""
+    if not items:
+        return
+    conn = _connect()
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO route_days (day, hash, payload) VALUES (?, ?, ?)",
+            [(day, h, json.dumps(payload, ensure_ascii=False)) for day, (h, payload) in items.items()]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def prune(keep_days):
+    """Удаляет дни, которых больше нет в исходной таблице"""
+    conn = _connect()
+    try:
+        keep = set(keep_days)
+        existing = [r[0] for r in conn.execute("SELECT day FROM route_days")]
+        stale = [(d,) for d in existing if d not in keep]
+        conn.executemany("DELETE FROM route_days WHERE day = ?", stale)
+        conn.commit()
+    finally:
+        conn.close()
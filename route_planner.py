@@ -0,0 +1,260 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+import utils
+import report_delivery
+import geo
+import device_coords
+
+IDADRES_FILE = 'idadres.csv'
+DEVICES_FILE = 'devices.csv'
+SUMMARY_FILE = 'service_routes_summary.csv'
+PLAN_FILE = 'route_plan.csv'
+
+# Пороги, по которым аппарат попадает в план объезда
+DV2_LOW = 1     # dv2day не больше этого значения
+DV6_ALARM = 1   # dv6raz не меньше этого значения
+TDS_MAX = 30    # TDS выше — пора менять фильтры
+
+START_POINT = (49.8397, 24.0297)  # центр Львова (как у карты маршрутов)
+
+# Имена техников в событиях Service -> имена в привязке
+TECH_ALIASES = {'ігор': 'igor', 'игорь': 'igor', 'дмитро': 'dmutro', 'руслан': 'ruslan'}
+
+
+# ======================== ЧТО НУЖНО ОБЪЕХАТЬ ========================
+
+def load_open_tasks():
+    """Открытые задачи всех исполнителей: [device_id, texnik, reason]"""
+    conn = utils.get_db_connection()
+    try:
+        return pd.read_sql_query(
+            "SELECT id_terem AS device_id, texnik, zadaca AS reason FROM tasks WHERE status='activ'", conn)
+    finally:
+        conn.close()
+
+
+def load_alarms():
+    """Аппараты с низким dv2, срабатываниями dv6 или высоким TDS: [device_id, reason]"""
+    if not os.path.exists(IDADRES_FILE):
+        return pd.DataFrame(columns=['device_id', 'reason'])
+    df = pd.read_csv(IDADRES_FILE, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    dv2 = pd.to_numeric(df.get('dv2day'), errors='coerce')
+    dv6 = pd.to_numeric(df.get('dv6raz'), errors='coerce')
+    tds = pd.to_numeric(df.get('TDS'), errors='coerce')
+
+    parts = [
+        pd.DataFrame({'device_id': df['id'], 'reason': 'dv2=' + df['dv2day']})[dv2 <= DV2_LOW],
+        pd.DataFrame({'device_id': df['id'], 'reason': 'dv6×' + df['dv6raz']})[dv6 >= DV6_ALARM],
+        pd.DataFrame({'device_id': df['id'], 'reason': 'TDS ' + df['TDS']})[tds > TDS_MAX],
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+
+def collect_stops():
+    """Одна строка на аппарат: [device_id, texnik, reason, addr, lat, lon]"""
+    tasks = load_open_tasks()
+    alarms = load_alarms()
+    alarms['texnik'] = ''
+    stops = pd.concat([tasks, alarms], ignore_index=True)
+    stops['device_id'] = pd.to_numeric(stops['device_id'], errors='coerce')
+    stops = stops.dropna(subset=['device_id'])
+    if stops.empty:
+        return pd.DataFrame(columns=['device_id', 'texnik', 'reason', 'addr', 'lat', 'lon'])
+    stops['device_id'] = stops['device_id'].astype(int)
+    stops['texnik'] = stops['texnik'].fillna('').astype(str).str.strip().str.lower()
+
+    stops = stops.groupby('device_id').agg(
+        texnik=('texnik', lambda s: next((t for t in s if t), '')),
+        reason=('reason', lambda s: '; '.join(dict.fromkeys(str(r) for r in s))),
+    ).reset_index()
+
+    coords = device_coords.by_ids(stops['device_id'])
+    stops = stops.merge(coords, on='device_id', how='left', suffixes=('', '_bind'))
+    stops['texnik'] = stops['texnik'].where(stops['texnik'] != '', stops['texnik_bind'].fillna(''))
+
+    # Аппараты, которых еще нет в таблице координат, — напрямую из devices.csv
+    if stops['lat'].isna().any() and os.path.exists(DEVICES_FILE):
+        dev = pd.read_csv(DEVICES_FILE, encoding='utf-8-sig')
+        dev = dev.rename(columns={'id': 'device_id'}).set_index('device_id')
+        missing = stops['lat'].isna()
+        stops.loc[missing, 'lat'] = stops.loc[missing, 'device_id'].map(dev['lat'])
+        stops.loc[missing, 'lon'] = stops.loc[missing, 'device_id'].map(dev['lon'])
+        stops.loc[stops['addr'].isna(), 'addr'] = stops['device_id'].map(dev['name'])
+
+    return stops.drop(columns=['texnik_bind'])
+
+
+# ======================== РЕШАТЕЛЬ ========================
+
+def path_km(order, D):
+    """Длина открытого пути по матрице расстояний"""
+    order = np.asarray(order)
+    return float(D[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbour(D, start=0):
+    n = len(D)
+    order, visited = [start], np.zeros(n, dtype=bool)
+    visited[start] = True
+    for _ in range(n - 1):
+        dist = np.where(visited, np.inf, D[order[-1]])
+        nxt = int(np.argmin(dist))
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+
+def two_opt(order, D):
+    """2-opt для открытого пути с фиксированной первой точкой"""
+    order = list(order)
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 2):
+            a, b = order[i], order[i + 1]
+            c = np.array(order[i + 2:])
+            d = np.array(order[i + 3:] + [-1])
+            has_d = d >= 0
+            # Разворот order[i+1..j]: ребра (a,b),(c,d) -> (a,c),(b,d)
+            delta = D[a, c] - D[a, b]
+            delta[has_d] += D[b, d[has_d]] - D[c[has_d], d[has_d]]
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-9:
+                j = i + 2 + k
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+                improved = True
+    return order
+
+
+def or_opt(order, D, max_len=3):
+    """Or-opt: перенос отрезков из 1..max_len точек в лучшее место (в т.ч. с разворотом)"""
+    order = list(order)
+    improved = True
+    while improved:
+        improved = False
+        for seg_len in range(1, max_len + 1):
+            i = 1
+            while i + seg_len <= len(order):
+                seg = order[i:i + seg_len]
+                prev = order[i - 1]
+                nxt = order[i + seg_len] if i + seg_len < len(order) else None
+                saved = D[prev, seg[0]]
+                if nxt is not None:
+                    saved += D[seg[-1], nxt] - D[prev, nxt]
+
+                rest = order[:i] + order[i + seg_len:]
+                p = np.array(rest)
+                q = np.array(rest[1:] + [-1])
+                has_q = q >= 0
+                best = None
+                for s in (seg, seg[::-1]):
+                    added = D[p, s[0]].astype(float)
+                    added[has_q] += D[s[-1], q[has_q]] - D[p[has_q], q[has_q]]
+                    k = int(np.argmin(added))
+                    if added[k] < saved - 1e-9 and (best is None or added[k] < best[0]):
+                        best = (added[k], k, s)
+                if best:
+                    _, k, s = best
+                    order = rest[:k + 1] + list(s) + rest[k + 1:]
+                    improved = True
+                i += 1
+    return order
+
+
+def solve(D):
+    """Порядок объезда от точки 0: ближайший сосед, затем 2-opt и Or-opt до сходимости"""
+    order = nearest_neighbour(D, 0)
+    best = path_km(order, D)
+    while True:
+        order = or_opt(two_opt(order, D), D)
+        km = path_km(order, D)
+        if km >= best - 1e-9:
+            return order
+        best = km
+
+
+# ======================== ПЛАН ========================
+
+def load_actual_km():
+    """Фактический км по техникам: среднее за день и последний день из service_routes_summary.csv"""
+    if not os.path.exists(SUMMARY_FILE):
+        return {}
+    df = pd.read_csv(SUMMARY_FILE, encoding='utf-8-sig')
+    if df.empty:
+        return {}
+    df['tech'] = df['tech'].astype(str).str.strip().str.lower().replace(TECH_ALIASES)
+    df = df.sort_values('date')
+    return {tech: (grp['km'].mean(), grp['km'].iloc[-1], grp['date'].iloc[-1])
+            for tech, grp in df.groupby('tech')}
+
+
+def plan_routes(start=START_POINT):
+    """Строит план объезда по техникам. Возвращает (DataFrame плана, текст отчета)."""
+    stops = collect_stops()
+    plan_rows = []
+    lines = ["🧭 ПЛАН МАРШРУТОВ", "=" * 35, f"Сформирован: {datetime.now().strftime('%d.%m.%Y %H:%M')}", ""]
+
+    if stops.empty:
+        lines.append("✅ Аппаратов для объезда нет")
+        return pd.DataFrame(), '\n'.join(lines)
+
+    no_coords = stops[stops['lat'].isna()]
+    stops = stops.dropna(subset=['lat', 'lon'])
+    actual = load_actual_km()
+
+    for tech, grp in stops.groupby('texnik'):
+        grp = grp.reset_index(drop=True)
+        lats = np.r_[start[0], grp['lat'].to_numpy(dtype=float)]
+        lons = np.r_[start[1], grp['lon'].to_numpy(dtype=float)]
+        D = geo.distance_matrix(lats, lons)
+
+        order = solve(D)
+        visit = [k - 1 for k in order[1:]]
+        # Тот же путь, что оптимизировал solve: от стартовой точки; выезд до первой точки — отдельно,
+        # чтобы было с чем сравнить факт (в service_routes_summary его нет)
+        planned = path_km(order, D)
+        naive = path_km(range(len(D)), D)
+        first_leg = D[order[0], order[1]]
+
+        for pos, k in enumerate(visit, 1):
+            leg = D[order[pos - 1], order[pos]]
+            r = grp.loc[k]
+            plan_rows.append({'texnik': tech or '—', 'order': pos, 'device_id': r['device_id'], 'addr': r['addr'],
+                              'reason': r['reason'], 'lat': r['lat'], 'lon': r['lon'], 'leg_km': round(leg, 3)})
+
+        lines.append(f"👤 {tech.upper() if tech else 'БЕЗ ТЕХНИКА'}: точек {len(visit)}")
+        lines.append(f"   План: {planned:.1f} км, из них до первой точки {first_leg:.1f} км "
+                     f"(без оптимизации {naive:.1f} км)")
+        if tech in actual:
+            mean_km, last_km, last_date = actual[tech]
+            lines.append(f"   Факт: в среднем {mean_km:.1f} км/день, {last_date}: {last_km:.1f} км")
+        for pos, k in enumerate(visit[:15], 1):
+            lines.append(f"   {pos}. {grp.loc[k, 'addr']} — {grp.loc[k, 'reason']}")
+        if len(visit) > 15:
+            lines.append(f"   ... еще {len(visit) - 15}")
+        lines.append("")
+
+    if not no_coords.empty:
+        lines.append(f"⚠️ Без координат: {', '.join(str(i) for i in no_coords['device_id'])}")
+
+    plan = pd.DataFrame(plan_rows)
+    plan.to_csv(PLAN_FILE, index=False, encoding='utf-8-sig')
+    return plan, '\n'.join(lines)
+
+
+def run(bot, chat_id):
+    try:
+        plan, text = plan_routes()
+        bot.send_message(chat_id, text[:4000])
+        if not plan.empty:
+            report_delivery.deliver(bot, chat_id, PLAN_FILE, caption="🧭 План объезда (CSV)")
+    except Exception as e:
+        bot.send_message(chat_id, f"❌ Ошибка планирования: {e}")
+
+
+if __name__ == "__main__":
+    print(plan_routes()[1])
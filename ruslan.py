@@ -1,8 +1,9 @@
 from telebot import types
 import utils
 
-# Для dmutro.py замените на 'zadaci_dmu', для igor.py на 'zadaci_igo'
-TABLE_NAME = 'zadaci_rus' 
+# Для dmutro.py замените на 'dmutro', для igor.py на 'igor'
+ASSIGNEE = 'ruslan'
+REPORT_NAME = 'otchet_work_rus'
 ROLE_NAME = 'техник'
 
 def get_keyboard():
@@ -15,11 +16,11 @@ def handle_message(bot, message):
     
     if text == 'отчет для работы':
         # Здесь вызов скрипта отчета (заглушка)
-        bot.send_message(message.chat.id, f"🚀 Запускаю otchet_work_{TABLE_NAME.split('_')[1]}...")
+        bot.send_message(message.chat.id, f"🚀 Запускаю {REPORT_NAME}...")
         # import otchet_work_rus; otchet_work_rus.run()
         
     elif text == 'поставленные задачи и карточки':
-        tasks = utils.get_active_tasks(TABLE_NAME)
+        tasks = utils.get_active_tasks(ASSIGNEE)
         if not tasks:
             bot.send_message(message.chat.id, "Все задачи выполнены! 🎉")
         else:
@@ -40,7 +41,7 @@ def handle_message(bot, message):
     elif text.endswith('+') and text[:-1].isdigit():
         # Закрытие задачи
         task_num = int(text[:-1])
-        success, msg = utils.close_task_db(TABLE_NAME, task_num)
+        success, msg = utils.close_task_db(ASSIGNEE, task_num)
         bot.send_message(message.chat.id, msg)
         
     elif text == 'выйти с роли':
@@ -0,0 +1,169 @@
+import os
+import json
+import pandas as pd
+from datetime import datetime, timedelta
+
+# Журнал событий Service (append-only). Имя файла прежнее, чтобы все
+# читатели service_mes.csv продолжали работать без изменений.
+SERVICE_LOG_FILE = 'service_mes.csv'
+SYNC_STATE_FILE = 'service_sync_state.json'
+LOG_COLUMNS = ['Дата', 'Подія', 'Апарат']
+
+# Потребители журнала: каждый помнит, с какого дня ему нужно пересчитать данные
+CONSUMERS = ['stage7', 'stage11']
+
+# Перекрытие окна загрузки (события за последние сутки запрашиваем повторно)
+OVERLAP_DAYS = 1
+
+# Форматы даты в журнале (все остальное — свободный разбор pandas)
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+
+def _clean_dt(series):
+    """Убирает звездочки и пробелы из строки даты (ключ дедупликации)"""
+    return series.astype(str).str.replace('*', ' ', regex=False).str.strip()
+
+
+def _event_keys(df):
+    """Ключ события: (дата, событие, аппарат)"""
+    return _clean_dt(df['Дата']) + '|' + df['Подія'].astype(str).str.strip() + '|' + df['Апарат'].astype(str).str.strip()
+
+
+def clean_datetime_column(col):
+    """
+    Векторная очистка колонки дат: убирает '*' и мусор, парсит по известным форматам,
+    свободный разбор pandas — только для оставшихся строк.
+    Возвращает (Series datetime64, кол-во отброшенных строк).
+    """
+    s = col.astype(str).str.replace("*", " ", regex=False)
+    s = s.str.replace(r"[^0-9:\- ]", "", regex=True).str.strip()
+    filled = s != ""
+
+    result = pd.to_datetime(s, format=DATETIME_FORMATS[0], errors="coerce")
+    for fmt in DATETIME_FORMATS[1:]:
+        left = result.isna() & filled
+        if not left.any():
+            break
+        result[left] = pd.to_datetime(s[left], format=fmt, errors="coerce")
+
+    left = result.isna() & filled
+    if left.any():
+        result[left] = s[left].apply(lambda v: pd.to_datetime(v, errors="coerce"))
+
+    return result, int(result.isna().sum())
+
+
+def load_state():
+    if not os.path.exists(SYNC_STATE_FILE):
+        return None
+    try:
+        with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_state(state):
+    # Пишем через временный файл, чтобы не оставить битый JSON при падении
+    tmp = SYNC_STATE_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, SYNC_STATE_FILE)
+
+
+def load_log():
+    """Читает журнал целиком (все колонки как строки)"""
+    if not os.path.exists(SERVICE_LOG_FILE):
+        return pd.DataFrame(columns=LOG_COLUMNS)
+    df = pd.read_csv(SERVICE_LOG_FILE, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    df.columns = LOG_COLUMNS
+    return df
+
+
+def get_high_water_mark():
+    """Время последнего известного события (datetime или None)"""
+    state = load_state()
+    if state and state.get('last_seen'):
+        return datetime.strptime(state['last_seen'], '%Y-%m-%d %H:%M:%S')
+
+    # Состояния нет — берем максимум из уже накопленного журнала
+    df = load_log()
+    if df.empty:
+        return None
+    dt = pd.to_datetime(_clean_dt(df['Дата']), errors='coerce').max()
+    return None if pd.isna(dt) else dt.to_pydatetime()
+
+
+def get_sync_start(default):
+    """Дата начала окна загрузки: high-water mark минус перекрытие, иначе default"""
+    hwm = get_high_water_mark()
+    if hwm is None:
+        return default
+    return (hwm - timedelta(days=OVERLAP_DAYS)).replace(hour=0, minute=0, second=0)
+
+
+def append_events(df_new):
+    """
+    Дописывает в журнал только новые события (дедупликация по дате, событию и аппарату).
+    Возвращает (кол-во добавленных, первый затронутый день 'YYYY-MM-DD' или None).
+    """
+    if df_new is None or df_new.empty:
+        return 0, None
+
+    df_new = df_new[LOG_COLUMNS].astype(str).apply(lambda s: s.str.strip())
+    new_keys = _event_keys(df_new)
+
+    log_exists = os.path.exists(SERVICE_LOG_FILE)
+    existing_keys = set(_event_keys(load_log())) if log_exists else set()
+
+    mask = ~new_keys.isin(existing_keys) & ~new_keys.duplicated()
+    added = df_new[mask]
+    if added.empty:
+        return 0, None
+
+    added.to_csv(SERVICE_LOG_FILE, mode='a', header=not log_exists, index=False, encoding='utf-8-sig')
+
+    added_dt = pd.to_datetime(_clean_dt(added['Дата']), errors='coerce').dropna()
+    dirty_from = added_dt.min().strftime('%Y-%m-%d') if not added_dt.empty else None
+
+    state = load_state()
+    fresh_state = state is None
+    if fresh_state:
+        # Потребители еще не работали с журналом — им нужен полный пересчет
+        state = {'last_seen': None, 'pending': {c: '' for c in CONSUMERS}}
+
+    if not added_dt.empty:
+        new_max = added_dt.max().strftime('%Y-%m-%d %H:%M:%S')
+        if not state.get('last_seen') or new_max > state['last_seen']:
+            state['last_seen'] = new_max
+
+    if dirty_from and not fresh_state:
+        pending = state.setdefault('pending', {})
+        for c in CONSUMERS:
+            prev = pending.get(c)
+            # '' означает полный пересчет — он покрывает любой день
+            if prev is None or (prev != '' and dirty_from < prev):
+                pending[c] = dirty_from
+
+    save_state(state)
+    return len(added), dirty_from
+
+
+def get_pending_since(consumer):
+    """
+    С какого дня потребителю нужно пересчитать данные:
+    'YYYY-MM-DD' — с этого дня, '' — полный пересчет, None — новых событий нет.
+    """
+    state = load_state()
+    if state is None:
+        return ''
+    return state.get('pending', {}).get(consumer)
+
+
+def mark_processed(consumer):
+    """Отмечает, что потребитель обработал все накопленные события"""
+    state = load_state()
+    if state is None:
+        return
+    state.get('pending', {}).pop(consumer, None)
+    save_state(state)
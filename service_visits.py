@@ -0,0 +1,200 @@
+import os
+import pandas as pd
+
+import service_log
+
+# Единый разбор журнала Service ON/OFF -> визиты техников.
+# Журнал читается и парсится один раз (кеш по mtime файла), из одной таблицы визитов
+# строятся все производные: service_tex_analitik.csv, texnik_za_mesyac.csv (+ _detailed)
+# и аналитика Stage 7.
+
+OUT_ANALITIK = 'service_tex_analitik.csv'
+OUT_DAILY = 'texnik_za_mesyac.csv'
+OUT_DETAILED = 'texnik_za_mesyac_detailed.csv'
+
+VISIT_COLUMNS = ['aparat', 'tech', 'start_dt', 'end_dt']
+
+_EVENTS = {'key': None, 'df': None, 'rejected': 0}
+
+
+def load_events(path=service_log.SERVICE_LOG_FILE):
+    """
+    События журнала: DataFrame [datetime, event, aparat] и кол-во строк с битой датой.
+    Повторный вызов без изменения файла — из памяти.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['datetime', 'event', 'aparat']), 0
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if _EVENTS['key'] != key:
+        df = pd.read_csv(path, encoding='utf-8-sig', dtype=str)
+        df.columns = ['datetime', 'event', 'aparat']
+        df['datetime'], rejected = service_log.clean_datetime_column(df['datetime'])
+        df = df.dropna(subset=['datetime'])
+        _EVENTS.update(key=key, df=df, rejected=rejected)
+    return _EVENTS['df'], _EVENTS['rejected']
+
+
+def pair_visits(events, since=''):
+    """
+    Визиты: пары Service ON -> Service OFF по каждому аппарату.
+    Повторный ON до OFF перезаписывает начало, OFF без открытого ON пропускается.
+    since — только события с этого дня плюс последнее ON/OFF аппарата до него
+    (иначе OFF визита, начатого раньше, остался бы без пары); такой визит начинается до since.
+    Возвращает DataFrame [aparat, tech, start_dt, end_dt].
+    """
+    text = events['event'].astype(str)
+    is_on = text.str.contains('Service ON', regex=False)
+    is_off = text.str.contains('Service OFF', regex=False) & ~is_on
+
+    ev = events[is_on | is_off].assign(is_on=is_on, tech=text.str.extract(r"Service ON - (.+)")[0])
+    ev = ev.sort_values(['aparat', 'datetime'], kind='stable')
+    if since:
+        before = ev['datetime'] < pd.Timestamp(since)
+        last_before = before & ~before.groupby(ev['aparat']).shift(-1, fill_value=False).astype(bool)
+        ev = ev[~before | last_before]
+    by_aparat = ev.groupby('aparat', sort=False)
+    prev_on = by_aparat['is_on'].shift(fill_value=False).astype(bool)
+    closes = ~ev['is_on'] & prev_on
+
+    visits = pd.DataFrame({
+        'aparat': ev.loc[closes, 'aparat'],
+        'tech': by_aparat['tech'].shift()[closes],
+        'start_dt': by_aparat['datetime'].shift()[closes],
+        'end_dt': ev.loc[closes, 'datetime'],
+    })
+    return visits.reset_index(drop=True)
+
+
+def pending_visits(events, since=''):
+    """
+    Визиты для пересчета с дня since: (visits, since).
+    Визит, начатый раньше since и закрытый уже в новом периоде, принадлежит дню начала —
+    since сдвигается на этот день, пока все визиты не начинаются не раньше since.
+    """
+    while True:
+        visits = pair_visits(events, since)
+        earliest = visits['start_dt'].min()
+        if not since or pd.isna(earliest) or earliest >= pd.Timestamp(since):
+            return visits, since
+        since = earliest.strftime('%Y-%m-%d')
+
+
+def analitik_view(visits):
+    """Строки service_tex_analitik.csv (без v_doroge и отметок точек — см. finalize_analitik)"""
+    return pd.DataFrame({
+        'data': visits['start_dt'].dt.date,
+        'aparat': visits['aparat'],
+        'start': visits['start_dt'].dt.time,
+        'tech': visits['tech'],
+        'end': visits['end_dt'].dt.time,
+        'kol-time': ((visits['end_dt'] - visits['start_dt']).dt.total_seconds() // 60).astype(int),
+        'v_doroge': 0,
+        'fir_point': '',
+        'last_point': '',
+    })
+
+
+def finalize_analitik(out):
+    """Сортировка, время в дороге и отметки первой/последней точки техника за день"""
+    out = out.sort_values(["data", "tech", "start"])
+
+    # Время в дороге: начало визита минус конец предыдущего визита техника
+    day = out["data"].astype(str)
+    start_dt = pd.to_datetime(day + " " + out["start"].astype(str))
+    end_dt = pd.to_datetime(day + " " + out["end"].astype(str))
+    prev_end = end_dt.groupby(out["tech"]).shift()
+    out["v_doroge"] = ((start_dt - prev_end).dt.total_seconds() // 60).fillna(0).astype(int)
+
+    by_day = out.groupby(["tech", "data"])
+    out["fir_point"] = by_day.cumcount().eq(0).map({True: "YES", False: ""})
+    out["last_point"] = by_day.cumcount(ascending=False).eq(0).map({True: "YES", False: ""})
+    return out
+
+
+def detailed_table(visits):
+    """texnik_za_mesyac_detailed.csv: визиты с техником, по аппаратам"""
+    v = visits.dropna(subset=['tech']).copy()
+    v['tech'] = v['tech'].str.strip()
+    v = v.sort_values(['aparat', 'start_dt'], kind='stable')
+    return pd.DataFrame({
+        'Дата': v['start_dt'].dt.date,
+        'Техник': v['tech'],
+        'Апарат': v['aparat'],
+        'Время начала': v['start_dt'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'Время окончания': v['end_dt'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'Продолжительность (мин)': ((v['end_dt'] - v['start_dt']).dt.total_seconds() / 60).round(2),
+    })
+
+
+def daily_summary(visits):
+    """texnik_za_mesyac.csv: техник за день — первый/последний визит, время работы, аппараты"""
+    v = visits.dropna(subset=['tech']).copy()
+    v['tech'] = v['tech'].str.strip()
+    v['Дата'] = v['start_dt'].dt.date
+    v['minutes'] = (v['end_dt'] - v['start_dt']).dt.total_seconds() / 60
+    if v.empty:
+        return pd.DataFrame(columns=['Дата', 'Техник', 'Первый раз', 'Последний раз',
+                                     'Работал за день (мин)', 'Количество аппаратов'])
+    g = v.groupby(['Дата', 'tech']).agg(first=('start_dt', 'min'), last=('end_dt', 'max'),
+                                         minutes=('minutes', lambda m: m.round(2).sum()),
+                                         aparats=('aparat', 'nunique')).reset_index()
+    return pd.DataFrame({
+        'Дата': g['Дата'],
+        'Техник': g['tech'],
+        'Первый раз': g['first'].dt.strftime('%H:%M:%S'),
+        'Последний раз': g['last'].dt.strftime('%H:%M:%S'),
+        'Работал за день (мин)': g['minutes'].round(2),
+        'Количество аппаратов': g['aparats'],
+    }).sort_values(['Дата', 'Техник'])
+
+
+def _keep_before(path, column, since):
+    """Прошлые дни из готового файла (для инкрементального пересчета)"""
+    old = pd.read_csv(path, encoding='utf-8-sig', dtype=str)
+    return old[old[column] < since]
+
+
+def build_outputs(since='', log=print):
+    """
+    Один проход по журналу: визиты и все производные таблицы.
+    since — пересчитать дни начиная с этой даты ('' — все), прошлые дни берутся из файлов.
+    Возвращает таблицу визитов (за пересчитанный период).
+    """
+    if since and not all(os.path.exists(p) for p in (OUT_ANALITIK, OUT_DAILY, OUT_DETAILED)):
+        since = ''
+
+    events, rejected = load_events()
+    if rejected:
+        log(f"⚠️ Отброшено строк с некорректной датой: {rejected}")
+    requested = since
+    visits, since = pending_visits(events, since)
+    if since != requested:
+        log(f"📅 Визит, начатый {since}, закрылся позже — пересчет с {since}")
+
+    out = analitik_view(visits)
+    daily = daily_summary(visits)
+    detailed = detailed_table(visits)
+
+    if since:
+        old = _keep_before(OUT_ANALITIK, 'data', since)
+        if not old.empty:
+            old["data"] = pd.to_datetime(old["data"]).dt.date
+            old["start"] = pd.to_datetime(old["start"], format="%H:%M:%S").dt.time
+            old["end"] = pd.to_datetime(old["end"], format="%H:%M:%S").dt.time
+            old["kol-time"] = old["kol-time"].astype(int)
+            out = pd.concat([old, out], ignore_index=True)
+        daily = pd.concat([_keep_before(OUT_DAILY, 'Дата', since), daily.astype({'Дата': str})], ignore_index=True)
+        old_detailed = _keep_before(OUT_DETAILED, 'Дата', since)
+        detailed = pd.concat([old_detailed, detailed.astype({'Дата': str})], ignore_index=True)
+        detailed = detailed.sort_values(['Апарат', 'Время начала'], kind='stable')
+
+    if out.empty:
+        log("⚠️ Данные отсутствуют — таблица пуста.")
+        return visits
+
+    finalize_analitik(out).to_csv(OUT_ANALITIK, index=False, encoding="utf-8-sig")
+    daily.to_csv(OUT_DAILY, index=False, encoding='utf-8-sig')
+    detailed.to_csv(OUT_DETAILED, index=False, encoding='utf-8-sig')
+    log(f"✅ Визитов: {len(visits)}, файлы: {OUT_ANALITIK}, {OUT_DAILY}, {OUT_DETAILED}")
+    return visits
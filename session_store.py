@@ -0,0 +1,124 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import utils
+
+# Состояние чатов бота (вход в роль, шаги диалога колцентра): LRU в памяти с TTL
+# и запись сразу в SQLite, чтобы после перезапуска пользователи не входили заново.
+# Изменения одного чата атомарны (замок чата), разные чаты друг друга не ждут:
+# общий замок держится только на время работы со словарем LRU, SQLite — вне его.
+
+MAX_ITEMS = 1000          # чатов в памяти на хранилище
+TOUCH_INTERVAL = 3600     # чтение продлевает TTL не чаще раза в час (иначе — запись на каждое сообщение)
+LOCK_STRIPES = 64         # замков чатов: chat_id -> замок по остатку, память не растет с числом чатов
+
+
+def ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            namespace TEXT,
+            chat_id INTEGER,
+            value TEXT,
+            updated REAL,
+            PRIMARY KEY (namespace, chat_id)
+        )
+    """)
+    conn.commit()
+
+
+class SessionStore:
+    def __init__(self, namespace, ttl, max_items=MAX_ITEMS):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_items = max_items
+        self.lock = threading.Lock()  # только self.items
+        self.items = OrderedDict()  # chat_id -> (value, updated)
+        self.chat_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        self._ready = False
+
+    def _conn(self):
+        conn = utils.db()
+        if not self._ready:
+            ensure_table(conn)
+            # Протухшие сессии чистим при первом обращении после старта
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE namespace = ? AND updated < ?",
+                             (self.namespace, time.time() - self.ttl))
+            self._ready = True
+        return conn
+
+    def _chat_lock(self, chat_id):
+        return self.chat_locks[hash(chat_id) % LOCK_STRIPES]
+
+    def _remember(self, chat_id, value, updated):
+        with self.lock:
+            self.items[chat_id] = (value, updated)
+            self.items.move_to_end(chat_id)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)  # из памяти; в SQLite остается до TTL
+
+    def _write(self, chat_id, value, updated):
+        with self._conn() as conn:
+            conn.execute("""
+                INSERT INTO sessions (namespace, chat_id, value, updated) VALUES (?, ?, ?, ?)
+                ON CONFLICT(namespace, chat_id) DO UPDATE SET value = excluded.value, updated = excluded.updated
+            """, (self.namespace, chat_id, json.dumps(value, ensure_ascii=False), updated))
+
+    def _delete(self, chat_id):
+        with self.lock:
+            self.items.pop(chat_id, None)
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE namespace = ? AND chat_id = ?", (self.namespace, chat_id))
+
+    def _load(self, chat_id):
+        """(value, updated) или None; протухшее удаляется. Вызывать под замком чата."""
+        with self.lock:
+            entry = self.items.get(chat_id)
+        if entry is None:
+            row = self._conn().execute("SELECT value, updated FROM sessions WHERE namespace = ? AND chat_id = ?",
+                                       (self.namespace, chat_id)).fetchone()
+            if row is None:
+                return None
+            entry = (json.loads(row[0]), row[1])
+        now = time.time()
+        if now - entry[1] > self.ttl:
+            self._delete(chat_id)
+            return None
+        if now - entry[1] > TOUCH_INTERVAL:
+            entry = (entry[0], now)
+            self._write(chat_id, entry[0], now)
+        self._remember(chat_id, *entry)
+        return entry
+
+    def get(self, chat_id, default=None):
+        with self._chat_lock(chat_id):
+            entry = self._load(chat_id)
+            return default if entry is None else entry[0]
+
+    def __contains__(self, chat_id):
+        return self.get(chat_id) is not None
+
+    def set(self, chat_id, value):
+        with self._chat_lock(chat_id):
+            now = time.time()
+            self._write(chat_id, value, now)
+            self._remember(chat_id, value, now)
+
+    def update(self, chat_id, fields):
+        """Дописывает поля в словарь состояния чата (атомарно), возвращает новое состояние"""
+        with self._chat_lock(chat_id):
+            entry = self._load(chat_id)
+            value = dict(entry[0]) if entry else {}
+            value.update(fields)
+            self.set(chat_id, value)
+            return value
+
+    def pop(self, chat_id, default=None):
+        with self._chat_lock(chat_id):
+            entry = self._load(chat_id)
+            if entry is None:
+                return default
+            self._delete(chat_id)
+            return entry[0]
@@ -6,6 +6,9 @@ from datetime import datetime, timedelta
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+import inkas_attribution
+import inkas_ledger
+
 class Stage10InkasProcessor:
     def __init__(self, callback=None):
         """
@@ -15,6 +18,7 @@ class Stage10InkasProcessor:
         self.INKAS_FILENAME = 'inkas5w.csv'
         self.PROCESSED_FILENAME = 'inkas5w_processed.csv'
         self.PRIVYAZKA_FILENAME = 'privyazka_tex_adres.csv'
+        self.REPORT_WEEKS = 5   # период inkas5w.csv для отчетов; весь журнал — в inkas_ledger
 
     def send_progress(self, stage, progress, message):
         """Отправка прогресса выполнения"""
@@ -65,7 +69,7 @@ class Stage10InkasProcessor:
         return None
 
     def _collect_inkas_data(self):
-        """Собирает данные инкасаций с API и сохраняет их в CSV."""
+        """Дозагружает инкассации в журнал (inkas_ledger) и выгружает последние 5 недель в CSV."""
         stage_name = "Этап 10.1/10"
         self.send_progress(stage_name, 0, "🌐 Инициализация API сессии и сбор данных...")
         
@@ -80,39 +84,42 @@ class Stage10InkasProcessor:
         self.send_progress(stage_name, 10, f"📋 Найдено аппаратов: {len(devices_list)}")
         
         today = datetime.now().date()
-        start_date = (today - timedelta(weeks=5)).strftime('%Y-%m-%d 00:00:00')
         end_date = today.strftime('%Y-%m-%d 23:59:59')
-        
-        self.send_progress(stage_name, 20, f"📅 Период парсинга: с {start_date} по {end_date}")
-        
-        inkas_data = []
-        total_devices = len(devices_list)
-
-        for i, device in enumerate(devices_list):
-            device_id = device['id']
-            progress = 20 + int((i / total_devices) * 60)
-            self.send_progress(stage_name, progress, f"📊 Сбор инкасаций для {device_id} ({i+1}/{total_devices})")
-            
-            inkas = self._get_device_inkas(session, device_id, start_date, end_date)
-            time.sleep(0.3)
-            
-            if inkas and inkas.get("status") == "success" and inkas.get("data"):
-                for item in inkas["data"]:
-                    inkas_data.append({
-                        "device_id": device_id,
-                        "address": inkas.get("address", ""),
-                        "date": item.get("date", ""),
-                        "card_id": item.get("card_id", ""),
-                        "sum": item.get("sum", ""),
-                        "banknotes": item.get("banknotes", ""),
-                        "coins": item.get("coins", ""),
-                        "descr": item.get("descr", "")
-                    })
-        
-        if inkas_data:
-            df = pd.DataFrame(inkas_data)
+
+        conn = inkas_ledger.connect()
+        try:
+            # Окно на аппарат: с прошлой загрузки минус перекрытие, новый аппарат — 5 недель
+            windows = {device['id']: inkas_ledger.fetch_start(conn, device['id'], today) for device in devices_list}
+            earliest = min(windows.values(), default=end_date)
+            self.send_progress(stage_name, 20, f"📅 Дозагрузка по {end_date}, самое раннее окно с {earliest}")
+
+            total_devices = len(devices_list)
+            added, failed = 0, 0
+            # Запросы по одному, с паузой, как и раньше — ускорение дает короткое окно, а не нагрузка на API
+            for i, (device_id, start) in enumerate(windows.items()):
+                progress = 20 + int((i / total_devices) * 60)
+                self.send_progress(stage_name, progress, f"📊 Сбор инкасаций для {device_id} ({i+1}/{total_devices})")
+
+                inkas = self._get_device_inkas(session, device_id, start, end_date)
+                time.sleep(0.3)
+
+                if inkas and inkas.get("status") == "success":
+                    added += inkas_ledger.store(conn, device_id, inkas.get("address", ""),
+                                                inkas.get("data") or [], end_date)
+                else:
+                    # Окно не отмечается загруженным — в следующий раз запросится снова
+                    failed += 1
+
+            df = inkas_ledger.query(conn, date_from=(today - timedelta(weeks=self.REPORT_WEEKS)).strftime('%Y-%m-%d'))
+        finally:
+            conn.close()
+
+        self.send_progress(stage_name, 85, f"🧾 Новых записей в журнале: {added}" +
+                           (f", аппаратов без ответа: {failed}" if failed else ""))
+
+        if not df.empty:
             df.to_csv(self.INKAS_FILENAME, index=False, encoding="utf-8-sig")
-            self.send_progress(stage_name, 90, f"✅ Создан файл {self.INKAS_FILENAME} с {len(inkas_data)} записями")
+            self.send_progress(stage_name, 90, f"✅ Создан файл {self.INKAS_FILENAME} с {len(df)} записями")
             return True
         else:
             self.send_progress(stage_name, 90, "❌ Не удалось собрать данные по инкасациям")
@@ -133,62 +140,20 @@ class Stage10InkasProcessor:
             self.send_progress(stage_name, 0, f"❌ Ошибка чтения {self.INKAS_FILENAME}: {e}")
             return False
 
+        binding = None
         if not os.path.exists(self.PRIVYAZKA_FILENAME):
-            self.send_progress(stage_name, 0, f"⚠️ Файл {self.PRIVYAZKA_FILENAME} не найден. Связывание не будет выполнено.")
-            df_privyazka = pd.DataFrame(columns=['id', 'texnik'])
+            self.send_progress(stage_name, 0, f"⚠️ Файл {self.PRIVYAZKA_FILENAME} не найден. Связывание по аппаратам не будет выполнено.")
         else:
             try:
-                df_privyazka = pd.read_csv(self.PRIVYAZKA_FILENAME, encoding='utf-8-sig', keep_default_na=False)
+                binding = inkas_attribution.load_binding(self.PRIVYAZKA_FILENAME)
             except Exception as e:
                 self.send_progress(stage_name, 0, f"❌ Ошибка чтения {self.PRIVYAZKA_FILENAME}: {e}")
-                df_privyazka = pd.DataFrame(columns=['id', 'texnik'])
-        
-        self.send_progress(stage_name, 20, "🔄 Обработка и стандартизация данных...")
-        
-        # Словарь для замены некорректных значений
-        replacements = {
-            'Р†РіРѕСЂ': 'igor',
-            'Р”РјРёС‚СЂРѕ': 'dmutro', 
-            'Р СѓСЃР»Р°РЅ': 'ruslan',
-            'Игорь': 'igor',
-            'Дмитро': 'dmutro',
-            'Руслан': 'ruslan'
-        }
-
-        # Применяем замены и стандартизацию
-        df_inkas['descr'] = df_inkas['descr'].astype(str).str.strip().replace(replacements, regex=False)
-        df_inkas['descr'] = df_inkas['descr'].str.lower().str.strip()
-
-        # Создаем словарь для сопоставления device_id с техником
-        device_to_tech = {}
-        if not df_privyazka.empty and 'id' in df_privyazka.columns and 'texnik' in df_privyazka.columns:
-            df_privyazka['id'] = pd.to_numeric(df_privyazka['id'], errors='coerce').fillna(0).astype(int)
-            df_privyazka['texnik'] = df_privyazka['texnik'].astype(str).str.lower().str.strip()
-            device_to_tech = df_privyazka.set_index('id')['texnik'].to_dict()
 
         self.send_progress(stage_name, 50, "🔗 Связывание данных с техниками...")
-        
-        # Заполняем пустые/некорректные значения descr из привязки
-        for idx, row in df_inkas.iterrows():
-            descr = str(row['descr']).strip()
-            
-            # Если descr пустое или неизвестное значение
-            if not descr or descr in ['nan', 'none', 'null', ''] or descr not in ['igor', 'dmutro', 'ruslan']:
-                device_id = pd.to_numeric(row['device_id'], errors='coerce')
-                
-                if pd.notna(device_id):
-                    device_id_int = int(device_id)
-                    tech_name = device_to_tech.get(device_id_int, '')
-                    
-                    if tech_name:
-                        df_inkas.at[idx, 'descr'] = tech_name
-
-        # Финальная очистка
-        df_inkas['descr'] = df_inkas['descr'].replace({
-            'nan': '', 
-            'none': '', 
-            'null': ''
-        }).fillna('').astype(str).str.strip()
+
+        # card_id -> привязка аппарата -> имя в descr; без техника остается очищенный descr
+        tech, _ = inkas_attribution.attribute(df_inkas, binding)
+        df_inkas['descr'] = tech.where(tech != '', inkas_attribution.normalize_descr(df_inkas['descr']))
 
         # Сохраняем результат
         df_inkas.to_csv(self.PROCESSED_FILENAME, index=False, encoding='utf-8-sig')
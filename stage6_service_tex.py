@@ -10,6 +10,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 
+import service_log
+
 
 class Stage6Parser:
     def __init__(self, callback=None):
@@ -206,14 +208,25 @@ class Stage6Parser:
 
             time.sleep(1.2)
 
-            # --- Сбор за месяц (прошлый) ---
+            # --- Сбор новых событий (с последней синхронизации) ---
+            # Без журнала — как раньше, с того же дня прошлого месяца
             current_month = datetime.now().month
             last_month = current_month - 1 if current_month > 1 else 12
-            if not self.safe_select_by_name('date_month_start', last_month):
-                self.send_progress("Этап 6/9", 60, "⚠️ Не удалось установить дату (месяц) — пропускаю месяц")
-            time.sleep(0.3)
+            last_month_year = yesterday.year if current_month > 1 else yesterday.year - 1
+            try:
+                default_start = yesterday.replace(year=last_month_year, month=last_month)
+            except ValueError:
+                default_start = yesterday.replace(year=last_month_year, month=last_month, day=28)
+            sync_start = service_log.get_sync_start(default=default_start)
+
+            for name, value in (('date_day_start', sync_start.day),
+                                ('date_month_start', sync_start.month),
+                                ('date_year_start', sync_start.year)):
+                if not self.safe_select_by_name(name, value):
+                    self.send_progress("Этап 6/9", 60, f"⚠️ Не удалось установить {name} — пропускаю")
+                time.sleep(0.3)
 
-            self.send_progress("Этап 6/9", 70, "🔄 Запрос данных за месяц...")
+            self.send_progress("Этап 6/9", 70, f"🔄 Запрос событий с {sync_start.strftime('%Y-%m-%d')}...")
             if not self.safe_find_and_click(By.CSS_SELECTOR, "input[type='submit'][value='Вивести']", wait_after=11):
                 self.send_progress("Этап 6/9", 0, "⚠️ Не удалось получить Service месяц — пропускаю")
                 return True
@@ -237,10 +250,10 @@ class Stage6Parser:
 
             df_month = pd.DataFrame(service_month_data)
             if not df_month.empty:
-                df_month.to_csv('service_mes.csv', index=False, encoding='utf-8-sig')
-                self.send_progress("Этап 6/9", 100, f"✅ Service месяц: {len(df_month)} записей")
+                added, dirty_from = service_log.append_events(df_month)
+                self.send_progress("Этап 6/9", 100, f"✅ Service: получено {len(df_month)}, новых {added} (пересчет с {dirty_from or '—'})")
             else:
-                self.send_progress("Этап 6/9", 100, "✅ Service месяц: записей нет")
+                self.send_progress("Этап 6/9", 100, "✅ Service: записей нет")
 
             return True
 
@@ -1,7 +1,9 @@
 import os
 import pandas as pd
 import re
-from datetime import datetime, timedelta
+
+import service_log
+import service_visits
 
 
 class Stage7Analyzer:
@@ -27,78 +29,52 @@ class Stage7Analyzer:
             return f"{main}, {match.group()}"
         return main
 
-    def _analyze_service_data(self, service_df, texnik_df):
-        """Анализ данных сервиса и создание аналитики по аппаратам"""
-        service_df['Апарат_норм'] = service_df['Апарат'].apply(self.parse_address)
-        
+    def _analyze_service_data(self, visits, texnik_df):
+        """Аналитика по аппаратам за день: от первого визита до последнего (визиты — из service_visits)"""
+        columns = ['data', 'aparat', 'start', 'texnik', 'end', 'kol-time', 'v_doroge', 'fir_point', 'last_point']
+        if visits.empty:
+            return pd.DataFrame(columns=columns)
+
         # Подготовка данных техников
         texnik_df['adress_норм'] = texnik_df['adress'].apply(self.parse_address)
-        texnik_dict = {}
-        for _, row in texnik_df.iterrows():
-            texnik_dict[row['adress_норм']] = row['texnik']
-
-        results = []
-        
-        service_df['Дата'] = pd.to_datetime(service_df['Дата'], errors='coerce')
-        service_df = service_df.dropna(subset=['Дата'])
-        service_df['Дата_day'] = service_df['Дата'].dt.date
-        
-        # Группировка по дате и нормализованному аппарату
-        grouped = service_df.groupby(['Дата_day', 'Апарат_норм'])
+        texnik_dict = dict(zip(texnik_df['adress_норм'], texnik_df['texnik']))
 
-        for (date, aparat_norm), group in grouped:
-            group_sorted = group.sort_values('Дата')
-            
-            on_events = group_sorted[group_sorted['Подія'].str.contains('ON', na=False, case=False)]
-            off_events = group_sorted[group_sorted['Подія'].str.contains('OFF', na=False, case=False)]
-            
-            if len(on_events) > 0 and len(off_events) > 0:
-                first_on = on_events.iloc[0]
-                last_off = off_events.iloc[-1]
-                
-                start_dt = first_on['Дата']
-                end_dt = last_off['Дата']
-                
-                # Защита от неправильного порядка ON/OFF
-                if end_dt < start_dt:
-                    continue
+        v = visits.sort_values('start_dt', kind='stable').copy()
+        names = v['aparat'].unique()
+        v['Апарат_норм'] = v['aparat'].map(dict(zip(names, map(self.parse_address, names))))
+        v['day'] = v['start_dt'].dt.date
 
-                start_time = start_dt.strftime('%H:%M:%S')
-                end_time = end_dt.strftime('%H:%M:%S')
-                
-                work_minutes = int((end_dt - start_dt).total_seconds() / 60)
-                
-                # Определение техника из строки события
-                texnik_name = ''
-                if 'ON -' in first_on['Подія']:
-                    texnik_match = re.search(r'ON - (.+)', first_on['Подія'])
-                    if texnik_match:
-                        texnik_name = texnik_match.group(1).strip()
-                
-                # Если не нашли в событии, ищем в таблице привязки
-                if not texnik_name and aparat_norm in texnik_dict:
-                    texnik_name = texnik_dict[aparat_norm]
-                
-                results.append({
-                    'data': date,
-                    'aparat': group_sorted.iloc[0]['Апарат'],
-                    'start': start_time,
-                    'texnik': texnik_name,
-                    'end': end_time,
-                    'kol-time': work_minutes,
-                    'v_doroge': '',
-                    'fir_point': start_time, # В оригинале тут время начала первого ON
-                    'last_point': end_time    # В оригинале тут время конца последнего OFF
-                })
-
-        return pd.DataFrame(results)
-
-    def _analyze_texnik_data(self, service_analytics):
-        """Анализ данных по техникам"""
+        # Группировка по дате и нормализованному аппарату
+        g = v.groupby(['day', 'Апарат_норм'], sort=True).agg(
+            aparat=('aparat', 'first'), start_dt=('start_dt', 'min'), end_dt=('end_dt', 'max'),
+            tech=('tech', 'first')).reset_index()
+
+        # Если техник не указан в событии, ищем в таблице привязки
+        texnik = g['tech'].fillna('').str.strip()
+        texnik = texnik.where(texnik != '', g['Апарат_норм'].map(texnik_dict).fillna(''))
+
+        start_time = g['start_dt'].dt.strftime('%H:%M:%S')
+        end_time = g['end_dt'].dt.strftime('%H:%M:%S')
+        return pd.DataFrame({
+            'data': g['day'],
+            'aparat': g['aparat'],
+            'start': start_time,
+            'texnik': texnik,
+            'end': end_time,
+            'kol-time': ((g['end_dt'] - g['start_dt']).dt.total_seconds() // 60).astype(int),
+            'v_doroge': '',
+            'fir_point': start_time,  # В оригинале тут время начала первого ON
+            'last_point': end_time,   # В оригинале тут время конца последнего OFF
+        }, columns=columns)
+
+    def _analyze_texnik_data(self, service_analytics, since=''):
+        """Анализ данных по техникам (since — только дни начиная с этой даты)"""
         results = []
         
         all_texniks = service_analytics['texnik'].dropna().unique()
         all_dates = service_analytics['data'].dropna().unique()
+        if since:
+            all_dates = [d for d in all_dates if d >= since]
         
         for date in all_dates:
             date_analytics = service_analytics[service_analytics['data'] == date]
@@ -165,15 +141,38 @@ class Stage7Analyzer:
                 texnik_df = pd.read_csv('privyazka_aparat_texnik.csv', encoding='utf-8-sig', keep_default_na=False)
 
 
-            service_df = pd.read_csv('service_mes.csv', encoding='utf-8-sig', keep_default_na=False)
-
-            self.send_progress("Этап 7/9", 10, f"📝 Загружено {len(service_df)} записей сервиса")
-
-            service_analytics = self._analyze_service_data(service_df, texnik_df)
-            texnik_analytics = self._analyze_texnik_data(service_analytics)
+            # Пересчитываем только дни, затронутые новыми событиями журнала
+            since = service_log.get_pending_since('stage7')
+            outputs_exist = os.path.exists('ser_mes_analitik.csv') and os.path.exists('tex_analitik.csv')
+            if not outputs_exist:
+                since = ''
+            elif since is None:
+                self.send_progress("Этап 7/9", 100, "✅ Новых событий нет — аналитика актуальна")
+                return True
+
+            # Журнал разбирается общим движком (тот же разбор, что и для Stage 11)
+            events, _ = service_visits.load_events()
+            visits, since = service_visits.pending_visits(events, since)
+
+            scope = f"с {since}" if since else "полный пересчет"
+            self.send_progress("Этап 7/9", 10, f"📝 Загружено {len(events)} записей сервиса, визитов {len(visits)} ({scope})")
+
+            service_analytics = self._analyze_service_data(visits, texnik_df)
+            if not service_analytics.empty:
+                service_analytics['data'] = service_analytics['data'].astype(str)
+
+            if since:
+                old_service = pd.read_csv('ser_mes_analitik.csv', encoding='utf-8-sig', keep_default_na=False, dtype={'data': str})
+                old_texnik = pd.read_csv('tex_analitik.csv', encoding='utf-8-sig', keep_default_na=False, dtype={'data': str})
+                service_analytics = pd.concat([old_service[old_service['data'] < since], service_analytics], ignore_index=True)
+                texnik_analytics = self._analyze_texnik_data(service_analytics, since)
+                texnik_analytics = pd.concat([old_texnik[old_texnik['data'] < since], texnik_analytics], ignore_index=True)
+            else:
+                texnik_analytics = self._analyze_texnik_data(service_analytics)
 
             service_analytics.to_csv('ser_mes_analitik.csv', index=False, encoding='utf-8-sig')
             texnik_analytics.to_csv('tex_analitik.csv', index=False, encoding='utf-8-sig')
+            service_log.mark_processed('stage7')
 
             self.send_progress("Этап 7/9", 100, f"✅ Аналитика создана: {len(service_analytics)} записей аппаратов, {len(texnik_analytics)} записей техников")
             return True
@@ -0,0 +1,161 @@
+from datetime import datetime
+
+# Агрегаты по задачам, которые обновляются при постановке и закрытии задачи
+# (в той же транзакции), чтобы KPI техника не требовали прохода по всей таблице tasks.
+#   task_stats            — счетчики на исполнителя ('texnik') и на аппарат ('device')
+#   task_reaction_minutes — сколько задач закрыто за ровно N минут: медиана и p90 точные,
+#                           строк — не больше, чем разных значений времени реакции
+#   task_stats_meta       — версия схемы агрегатов: пересчет по истории только при ее смене
+
+# Версия агрегатов; поменялась схема или смысл — ensure_tables один раз пересчитает их по tasks
+STATS_VERSION = 2
+# Возраст открытых задач, часы
+BACKLOG_AGES = [(24, 'до суток'), (72, '1-3 дня'), (168, '3-7 дней'), (None, 'больше недели')]
+
+
+def ensure_tables(conn):
+    """Создает таблицы агрегатов; при новой версии схемы (в т.ч. первый запуск) заполняет их по истории"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS task_stats (
+            scope TEXT,
+            key TEXT,
+            opened INTEGER DEFAULT 0,
+            closed INTEGER DEFAULT 0,
+            sum_minutes INTEGER DEFAULT 0,
+            max_minutes INTEGER DEFAULT 0,
+            PRIMARY KEY (scope, key)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS task_reaction_minutes (
+            scope TEXT,
+            key TEXT,
+            minutes INTEGER,
+            cnt INTEGER DEFAULT 0,
+            PRIMARY KEY (scope, key, minutes)
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS task_stats_meta (name TEXT PRIMARY KEY, value INTEGER)")
+    conn.commit()
+    row = conn.execute("SELECT value FROM task_stats_meta WHERE name = 'version'").fetchone()
+    if not row or row[0] != STATS_VERSION:
+        # Гистограмма корзин прежней версии больше не нужна
+        conn.execute("DROP TABLE IF EXISTS task_reaction_hist")
+        rebuild(conn)
+        with conn:
+            conn.execute("INSERT INTO task_stats_meta (name, value) VALUES ('version', ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (STATS_VERSION,))
+
+
+def _keys(assignee, id_terem):
+    return [('texnik', str(assignee)), ('device', str(id_terem))]
+
+
+def on_open(conn, assignee, id_terem):
+    """Новая задача (вызывать внутри транзакции записи задачи)"""
+    for scope, key in _keys(assignee, id_terem):
+        conn.execute("""
+            INSERT INTO task_stats (scope, key, opened) VALUES (?, ?, 1)
+            ON CONFLICT(scope, key) DO UPDATE SET opened = opened + 1
+        """, (scope, key))
+
+
+def on_close(conn, assignee, id_terem, minutes):
+    """Закрытая задача (вызывать внутри транзакции закрытия)"""
+    minutes = max(int(minutes or 0), 0)
+    for scope, key in _keys(assignee, id_terem):
+        conn.execute("""
+            INSERT INTO task_stats (scope, key, closed, sum_minutes, max_minutes) VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT(scope, key) DO UPDATE SET closed = closed + 1, sum_minutes = sum_minutes + excluded.sum_minutes,
+                max_minutes = MAX(max_minutes, excluded.max_minutes)
+        """, (scope, key, minutes, minutes))
+        conn.execute("""
+            INSERT INTO task_reaction_minutes (scope, key, minutes, cnt) VALUES (?, ?, ?, 1)
+            ON CONFLICT(scope, key, minutes) DO UPDATE SET cnt = cnt + 1
+        """, (scope, key, minutes))
+
+
+def rebuild(conn):
+    """Полный пересчет агрегатов по таблице tasks (первый запуск, ручное восстановление)"""
+    rows = conn.execute("SELECT assignee, id_terem, status, vremyareakcii FROM tasks").fetchall()
+    with conn:
+        conn.execute("DELETE FROM task_stats")
+        conn.execute("DELETE FROM task_reaction_minutes")
+        for assignee, id_terem, status, minutes in rows:
+            on_open(conn, assignee, id_terem)
+            if status == 'finish':
+                on_close(conn, assignee, id_terem, minutes)
+    return len(rows)
+
+
+def _quantile(counts, total, q):
+    """Квантиль q по парам (минуты, кол-во) в порядке возрастания — с интерполяцией, как numpy.quantile"""
+    pos = (total - 1) * q
+    lo, hi = int(pos), min(int(pos) + 1, total - 1)
+    values, seen = {}, 0
+    for minutes, cnt in counts:
+        for rank in (lo, hi):
+            if rank not in values and rank < seen + cnt:
+                values[rank] = minutes
+        seen += cnt
+        if hi in values:
+            break
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def kpi(conn, scope, key):
+    """Счетчики и время реакции (среднее, медиана, p90, максимум) для исполнителя или аппарата"""
+    row = conn.execute("SELECT opened, closed, sum_minutes, max_minutes FROM task_stats WHERE scope = ? AND key = ?",
+                       (scope, str(key))).fetchone()
+    if not row:
+        return None
+    opened, closed, sum_minutes, max_minutes = row
+    counts = conn.execute("SELECT minutes, cnt FROM task_reaction_minutes WHERE scope = ? AND key = ? ORDER BY minutes",
+                          (scope, str(key))).fetchall()
+
+    def quantile(q):
+        return round(_quantile(counts, closed, q)) if closed else None
+
+    return {
+        'opened': opened,
+        'closed': closed,
+        'open': opened - closed,
+        'avg': round(sum_minutes / closed) if closed else None,
+        'median': quantile(0.5),
+        'p90': quantile(0.9),
+        'max': max_minutes if closed else None,
+    }
+
+
+def backlog_by_age(conn, assignee=None, now=None):
+    """Открытые задачи по возрасту: {подпись: кол-во} (только активные строки — по индексу статуса)"""
+    now = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    sql = "SELECT (julianday(?) - julianday(date_time_start)) * 24 FROM tasks WHERE status = 'activ'"
+    params = [now]
+    if assignee:
+        sql = "SELECT (julianday(?) - julianday(date_time_start)) * 24 FROM tasks WHERE assignee = ? AND status = 'activ'"
+        params.append(assignee)
+    counts = {label: 0 for _, label in BACKLOG_AGES}
+    for (hours,) in conn.execute(sql, params):
+        hours = hours or 0
+        label = next(label for limit, label in BACKLOG_AGES if limit is None or hours < limit)
+        counts[label] += 1
+    return counts
+
+
+def format_report(conn):
+    """Текст отчета по техникам для бота"""
+    lines = ["📈 СТАТУС ВЫПОЛНЕНИЯ ЗАДАЧ", "=" * 30]
+    keys = [r[0] for r in conn.execute("SELECT key FROM task_stats WHERE scope = 'texnik' ORDER BY key")]
+    if not keys:
+        return "\n".join(lines + ["Задач еще нет."])
+    for key in keys:
+        s = kpi(conn, 'texnik', key)
+        lines.append(f"👤 {key}: поставлено {s['opened']}, закрыто {s['closed']}, открыто {s['open']}")
+        if s['closed']:
+            lines.append(f"   Реакция, мин: среднее {s['avg']}, медиана {s['median']}, "
+                         f"p90 {s['p90']}, максимум {s['max']}")
+        if s['open']:
+            ages = ", ".join(f"{label}: {cnt}" for label, cnt in backlog_by_age(conn, key).items() if cnt)
+            lines.append(f"   Открытые: {ages}")
+    return "\n".join(lines)
@@ -2,10 +2,13 @@ import telebot
 from telebot import types
 import time
 import logging
-import sys
 import os
 from dotenv import load_dotenv
 
+import chat_dispatcher
+import lazy_loader
+import session_store
+
 # Загружаем .env
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
@@ -13,22 +16,24 @@ TOKEN = os.getenv("TOKEN")
 if TOKEN is None:
     raise ValueError("❌ TOKEN не найден! Убедись, что он есть в файле .env")
 
-bot = telebot.TeleBot(TOKEN)
+# Поток polling только раскладывает апдейты по очередям чатов, обработка — в пуле chat_dispatcher
+bot = telebot.TeleBot(TOKEN, threaded=False)
+DISPATCHER = chat_dispatcher.ChatDispatcher()
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, filename="bot_log.log", filemode="w",
                     format="%(asctime)s %(levelname)s %(message)s")
 
-# --- ИМПОРТ РОЛЕЙ ---
-try:
-    import ruslan
-    import dmutro
-    import igor
-    import calcentr
-    import admin
-except ImportError as e:
-    print(f"⚠️ Ошибка импорта ролей: {e}")
-    logging.error(f"Import error: {e}")
+# --- РОЛИ ---
+# Модули ролей импортируются при первом входе (или фоновым прогревом после старта),
+# admin с парсерами — только когда он действительно нужен
+ruslan = lazy_loader.lazy('ruslan')
+dmutro = lazy_loader.lazy('dmutro')
+igor = lazy_loader.lazy('igor')
+calcentr = lazy_loader.lazy('calcentr')
+admin = lazy_loader.lazy('admin')
+
+ROLE_MODULES = {'ruslan': ruslan, 'dmutro': dmutro, 'igor': igor, 'calcentr': calcentr, 'admin': admin}
 
 # Пароли для входа
 PASSWORDS = {
@@ -42,26 +47,48 @@ PASSWORDS = {
     'adiz': 'admin'
 }
 
-# Хранилище сессий: chat_id -> module
-USER_SESSIONS = {}
+# Хранилище сессий: chat_id -> роль (SQLite, переживает перезапуск; без активности — выход через 30 дней)
+SESSION_TTL = 30 * 24 * 3600
+USER_SESSIONS = session_store.SessionStore('role', ttl=SESSION_TTL)
+
+def _label(chat_id):
+    """Метка для метрик: роль чата или авторизация"""
+    return USER_SESSIONS.get(chat_id) or 'авторизация'
 
 @bot.message_handler(commands=['start'])
+def on_start(message):
+    DISPATCHER.submit(message.chat.id, send_welcome, message, label='start')
+
+@bot.message_handler(commands=['stats'])
+def on_stats(message):
+    DISPATCHER.submit(message.chat.id, send_stats, message, label='stats')
+
+@bot.message_handler(func=lambda message: True)
+def on_message(message):
+    DISPATCHER.submit(message.chat.id, dispatcher, message, label=_label(message.chat.id))
+
 def send_welcome(message):
     bot.send_message(message.chat.id, "👋 Привет! Введите кодовое слово для авторизации:")
 
-@bot.message_handler(func=lambda message: True)
+def send_stats(message):
+    # Метрики обработки — только для админа
+    if _label(message.chat.id) != 'admin':
+        bot.send_message(message.chat.id, "⛔️ Нет доступа.")
+        return
+    bot.send_message(message.chat.id, DISPATCHER.stats.text())
+
 def dispatcher(message):
     try:
         chat_id = message.chat.id
         text = message.text.strip() if message.text else ""
 
         # 1. Если пользователь уже авторизован
-        if chat_id in USER_SESSIONS:
-            role_module = USER_SESSIONS[chat_id]
+        role_module = ROLE_MODULES.get(USER_SESSIONS.get(chat_id))
+        if role_module:
             result = role_module.handle_message(bot, message)
 
             if result == "EXIT":
-                del USER_SESSIONS[chat_id]
+                USER_SESSIONS.pop(chat_id)
                 bot.send_message(chat_id, "🔒 Вы вышли. Введите пароль снова:",
                                  reply_markup=types.ReplyKeyboardRemove())
             return
@@ -70,17 +97,17 @@ def dispatcher(message):
         if text in PASSWORDS:
             role_key = PASSWORDS[text]
 
-            if role_key == 'ruslan': USER_SESSIONS[chat_id] = ruslan
-            elif role_key == 'dmutro': USER_SESSIONS[chat_id] = dmutro
-            elif role_key == 'igor': USER_SESSIONS[chat_id] = igor
-            elif role_key == 'calcentr': USER_SESSIONS[chat_id] = calcentr
-            elif role_key == 'admin': USER_SESSIONS[chat_id] = admin
-            else:
+            if role_key not in ROLE_MODULES:
                 bot.send_message(chat_id, f"⚠️ Роль '{role_key}' в разработке.")
                 return
+            # bool(модуль) == False — модуль роли не импортируется (нет файла или зависимостей)
+            if not ROLE_MODULES[role_key]:
+                bot.send_message(chat_id, f"❌ Модуль роли {role_key}.py не найден.")
+                return
+            USER_SESSIONS.set(chat_id, role_key)
 
             try:
-                markup = USER_SESSIONS[chat_id].get_keyboard()
+                markup = ROLE_MODULES[role_key].get_keyboard()
                 bot.send_message(chat_id, f"✅ Добро пожаловать, {role_key.upper()}!",
                                  reply_markup=markup)
             except AttributeError:
@@ -99,6 +126,8 @@ def dispatcher(message):
 
 if __name__ == '__main__':
     print("🤖 Бот запущен...")
+    # Легкие роли техников и колцентра — прогрев в фоне, пока идет первый запрос polling
+    lazy_loader.preload(ruslan, dmutro, igor, calcentr)
     while True:
         try:
             bot.infinity_polling(timeout=60, long_polling_timeout=20)
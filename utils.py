@@ -1,71 +1,114 @@
-import pandas as pd
 import sqlite3
+import threading
 from datetime import datetime
-import os
 
-DB_FILE = 'voda_analitik.db'
+import device_directory
+import create_db
+import task_stats
+
+DB_FILE = create_db.DB_FILE
 CSV_FILE = 'privyazka_aparat_texnik.csv'
 
+# Исполнители, у которых есть свой список задач в боте (роли ruslan, dmutro, igor)
+TECH_ASSIGNEES = ('ruslan', 'dmutro', 'igor')
+
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def _tune(conn):
+    # WAL: читатели не ждут писателя; NORMAL в WAL безопасен при падении процесса
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    return conn
+
+def _ensure_schema(conn):
+    # Таблица tasks и перенос старых zadaci_* — один раз на файл БД за процесс
+    with _schema_lock:
+        if DB_FILE in _schema_ready:
+            return
+        create_db.create_tasks_table(conn)
+        conn.commit()
+        moved, renumbered = create_db.migrate_legacy_tables(conn)
+        if moved:
+            print(f"📦 Задачи перенесены в общую таблицу tasks: {moved}")
+        for assignee, old_num, new_num in renumbered:
+            print(f"⚠️ {assignee}: активная задача {old_num} теперь под номером {new_num}")
+        task_stats.ensure_tables(conn)
+        _schema_ready.add(DB_FILE)
+
 def get_db_connection():
-    return sqlite3.connect(DB_FILE)
+    """Отдельное соединение (вызывающий закрывает сам) — для разовых выгрузок"""
+    conn = _tune(sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000))
+    _ensure_schema(conn)
+    return conn
+
+def db():
+    """
+    Соединение текущего потока: открывается один раз и переиспользуется
+    (вместе с кешем подготовленных запросов). Закрывать не нужно.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'db_file', None) != DB_FILE:
+        conn = _tune(sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                                     cached_statements=DB_CACHED_STATEMENTS))
+        _local.conn, _local.db_file = conn, DB_FILE
+        _ensure_schema(conn)
+    return conn
 
 def smart_search_device(query):
     """
     Умный поиск аппарата в CSV файле.
     Исправленная версия: игнорирует типы данных, пробелы и регистр.
+    Файл читается один раз (справочник device_directory), поиск — по индексам.
     """
-    if not os.path.exists(CSV_FILE):
+    directory = device_directory.get_directory(CSV_FILE)
+    if not directory.refresh():
         print(f"❌ Ошибка: Файл {CSV_FILE} не найден!")
         return None, "Файл привязки не найден!"
     
     try:
-        # 1. Читаем всё как строки (dtype=str), чтобы "153" и 153 были равны
-        df = pd.read_csv(CSV_FILE, encoding='utf-8-sig', dtype=str, keep_default_na=False)
-        
-        # 2. Очищаем запрос пользователя
         user_query = str(query).strip().lower()
         print(f"🔍 Поиск по запросу: '{user_query}'") # Диагностика в консоль
 
-        # 3. Подготовка данных в таблице для поиска (создаем временные колонки для сравнения)
-        # Убираем пробелы вокруг, переводим в нижний регистр
-        df['id_clean'] = df['id_terem'].str.strip().str.lower()
-        df['addr_clean'] = df['adress'].str.strip().str.lower()
-        
-        # 4. Поиск
-        # А) Точное совпадение по ID (или если ID содержит этот номер)
-        mask_id = df['id_clean'] == user_query
-        
-        # Б) Частичное совпадение по адресу
-        mask_addr = df['addr_clean'].str.contains(user_query, regex=False)
-        
-        # Объединяем результаты
-        results = df[mask_id | mask_addr]
+        # Точное совпадение по ID или частичное по адресу
+        results = directory.find(user_query)
         
         # Диагностика в консоль (показывает, сколько нашли)
         print(f"📊 Найдено совпадений: {len(results)}")
 
-        if results.empty:
-            return None, "Аппарат не найден. Попробуйте ввести только номер (например 153) или часть улицы."
+        if not results:
+            # Нечеткий поиск: опечатки, слитное написание, укр./рус./латиница
+            ranked = directory.search(user_query, k=5)
+            if not ranked:
+                return None, "Аппарат не найден. Попробуйте ввести только номер (например 153) или часть улицы."
+            best_score, best = ranked[0]
+            second_score = ranked[1][0] if len(ranked) > 1 else 0
+            # Сам по себе — только если номер дома тот же: 'Сліпого, 23' при единственном 'Сліпого, 22' — не он
+            if (best_score >= device_directory.FUZZY_ACCEPT and best_score - second_score >= device_directory.FUZZY_MARGIN
+                    and device_directory.house_numbers(user_query) == device_directory.house_numbers(best['adress'])):
+                print(f"✅ Успех (нечетко, {best_score:.0%}): {best['adress']} -> {best['texnik']}")
+                return best, "Found"
+            found_list = "\n".join([f"🔹 {row['id_terem']} - {row['adress']} ({score:.0%})" for score, row in ranked])
+            return None, f"Точного совпадения нет. Возможно:\n{found_list}\n🔻 Введите ID аппарата."
         
         if len(results) > 1:
             # Если нашли больше одного (например ввели "Ленина", а там "Ленина 1" и "Ленина 5")
             # Мы попробуем найти точное совпадение среди них
-            exact_match = results[results['id_clean'] == user_query]
+            exact_match = [r for r in results if r['id_terem'].strip().lower() == user_query]
             if len(exact_match) == 1:
                 results = exact_match
             else:
                 # Формируем список подсказок
-                found_list = "\n".join([f"🔹 {row['id_terem']} - {row['adress']}" for index, row in results.head(5).iterrows()])
+                found_list = "\n".join([f"🔹 {row['id_terem']} - {row['adress']}" for row in results[:5]])
                 return None, f"Найдено несколько вариантов:\n{found_list}\n🔻 Уточните запрос (введите конкретный ID)."
             
         # Возвращаем данные единственного найденного аппарата
-        # Превращаем результат обратно в словарь, убирая наши служебные колонки
-        found_item = results.iloc[0].to_dict()
-        
-        # Чистим словарь от служебных полей перед отдачей
-        if 'id_clean' in found_item: del found_item['id_clean']
-        if 'addr_clean' in found_item: del found_item['addr_clean']
-            
+        found_item = results[0]
         print(f"✅ Успех: {found_item['adress']} -> {found_item['texnik']}")
         return found_item, "Found"
         
@@ -73,36 +116,32 @@ def smart_search_device(query):
         print(f"🔥 Ошибка поиска: {e}")
         return None, f"Ошибка поиска: {e}"
 
-def add_task_to_db(table_name, id_terem, adress, zadaca, texnik):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def add_task_to_db(assignee, id_terem, adress, zadaca, texnik):
+    conn = db()
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    print(f"💾 Сохранение задачи в {table_name}: {zadaca}")
+    print(f"💾 Сохранение задачи для {assignee}: {zadaca}")
     
     try:
-        cursor.execute(f"""
-            INSERT INTO {table_name} (id_terem, adress, zadaca, texnik, date_time_start, status)
-            VALUES (?, ?, ?, ?, ?, 'activ')
-        """, (id_terem, adress, zadaca, texnik, now))
-        conn.commit()
+        with conn:
+            conn.execute("""
+                INSERT INTO tasks (assignee, id_terem, adress, zadaca, texnik, date_time_start, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'activ')
+            """, (assignee, id_terem, adress, zadaca, texnik, now))
+            task_stats.on_open(conn, assignee, id_terem)
     except Exception as e:
         print(f"❌ Ошибка записи в БД: {e}")
-    finally:
-        conn.close()
 
-def close_task_db(table_name, task_num):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def close_task_db(assignee, task_num):
+    conn = db()
     
-    cursor.execute(f"SELECT date_time_start FROM {table_name} WHERE num = ? AND status = 'activ'", (task_num,))
-    row = cursor.fetchone()
+    row = conn.execute("SELECT date_time_start, id_terem FROM tasks WHERE num = ? AND assignee = ? AND status = 'activ'",
+                       (task_num, assignee)).fetchone()
     
     if not row:
-        conn.close()
         return False, "Задача не найдена или уже закрыта."
     
-    start_time_str = row[0]
+    start_time_str, id_terem = row
     try:
         start_time = datetime.strptime(start_time_str, "%Y-%m-%d %H:%M:%S")
     except:
@@ -113,25 +152,29 @@ def close_task_db(table_name, task_num):
     reaction_minutes = int((finish_time - start_time).total_seconds() / 60)
     finish_time_str = finish_time.strftime("%Y-%m-%d %H:%M:%S")
     
-    cursor.execute(f"""
-        UPDATE {table_name} 
-        SET status = 'finish', date_time_finish = ?, vremyareakcii = ?
-        WHERE num = ?
-    """, (finish_time_str, reaction_minutes, task_num))
+    with conn:
+        # Статус проверяется еще раз в самом UPDATE: при двойном нажатии закроет только один
+        cur = conn.execute("""
+            UPDATE tasks 
+            SET status = 'finish', date_time_finish = ?, vremyareakcii = ?
+            WHERE num = ? AND assignee = ? AND status = 'activ'
+        """, (finish_time_str, reaction_minutes, task_num, assignee))
+        if cur.rowcount != 1:
+            return False, "Задача не найдена или уже закрыта."
+        task_stats.on_close(conn, assignee, id_terem, reaction_minutes)
     
-    conn.commit()
-    conn.close()
     return True, f"Задача {task_num} закрыта. Время реакции: {reaction_minutes} мин."
 
-def get_active_tasks(table_name):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def get_active_tasks(assignee):
     try:
-        cursor.execute(f"SELECT num, id_terem, adress, zadaca, date_time_start FROM {table_name} WHERE status='activ'")
-        tasks = cursor.fetchall()
-        return tasks
+        # Индекс (assignee, status) выбирает только активные строки исполнителя и уже отсортирован
+        # по num (rowid); сами поля читаются из таблицы по rowid — индекс не покрывающий
+        return db().execute("SELECT num, id_terem, adress, zadaca, date_time_start FROM tasks "
+                            "WHERE assignee = ? AND status = 'activ' ORDER BY num", (assignee,)).fetchall()
     except Exception as e:
         print(f"Ошибка чтения БД: {e}")
         return []
-    finally:
-        conn.close()
\ No newline at end of file
+
+def get_task_report():
+    """KPI техников из агрегатов task_stats"""
+    return task_stats.format_report(db())